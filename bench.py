@@ -0,0 +1,288 @@
+"""
+Scaling benchmark for the topomux pipeline.
+
+Builds the same kind of topology as main.py at several sizes and records
+the time and memory of each stage. Each size runs in its own process so
+that memory readings do not carry over between sizes. Results are written
+as one JSON object per (size, stage), can be saved as a baseline and
+compared against one.
+
+Memory fields, in bytes:
+
+    peak_bytes             resident set high-water mark during the stage
+    peak_delta_bytes       peak_bytes less the resident set at its start,
+                           i.e. the most memory the stage added
+    rss_delta_bytes        change of the resident set over the stage
+    cumulative_peak_bytes  high-water mark of the process so far
+
+The per-stage peaks reset the kernel's high-water mark before each stage
+through /proc/self/clear_refs, so they are only available on Linux; they
+are null elsewhere.
+
+    python bench.py --scales 0.25,0.5,1 --output results.json
+    python bench.py --scales 0.25,0.5,1 --baseline results.json
+"""
+from topomux import ImportedTopology, IcnRoutes, TopoJoiner
+import argparse, json, math, multiprocessing, os, Queue, random, resource, shutil, sys, tempfile, time
+import fnss.topologies as ft
+
+STAGES = ["import", "mst", "join", "physical", "routes", "export_topology", "export_routes"]
+
+def cumulativePeak():
+        """ Returns the peak resident set size of this process over its
+            lifetime, in bytes
+        """
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def memoryStatus():
+        """ Returns the (current, peak) resident set size of this process in
+            bytes, or None where /proc/self/status is not available
+        """
+        fields = {}
+        try:
+                with open("/proc/self/status") as f:
+                        for line in f:
+                                name, _, value = line.partition(":")
+                                if name in ("VmRSS", "VmHWM"):
+                                        fields[name] = int(value.split()[0]) * 1024
+        except IOError:
+                return None
+        return fields["VmRSS"], fields["VmHWM"]
+
+def resetPeak():
+        """ Resets the resident set high-water mark of this process to its
+            current size. Returns False where this is not supported.
+        """
+        try:
+                with open("/proc/self/clear_refs", "w") as f:
+                        f.write("5")
+        except IOError:
+                return False
+        return True
+
+def pipeline(params, record):
+        """ Runs the stages of main.py for one set of parameters, calling
+            record(stage, seconds, memory) after each, where memory holds
+            the memory fields of the stage
+        """
+        random.seed(params["seed"])
+        state = {}
+
+        def stage(name, function):
+                before = memoryStatus() if resetPeak() else None
+                start = time.time()
+                function()
+                seconds = time.time() - start
+                memory = {"peak_bytes": None, "peak_delta_bytes": None, "rss_delta_bytes": None}
+                after = memoryStatus()
+                if before != None and after != None:
+                        memory = {
+                                "peak_bytes": after[1],
+                                "peak_delta_bytes": after[1] - before[0],
+                                "rss_delta_bytes": after[0] - before[0],
+                        }
+                memory["cumulative_peak_bytes"] = cumulativePeak()
+                record(name, seconds, memory)
+
+        def importLayers():
+                compute = ImportedTopology(ft.full_mesh_topology(params["compute"]))
+                compute.prefixAllNodes("/direct/com")
+                compute.prefixAllNodes("/overlay/com")
+                compute.labelAllNodes("compute")
+                compute.labelAllEdges("compute")
+                aggrega = ImportedTopology(ft.barabasi_albert_topology(
+                        params["aggregate"], params["attach"], params["attach"] * 5, seed=params["seed"]
+                ))
+                aggrega.prefixAllNodes("/direct/agg")
+                aggrega.prefixAllNodes("/overlay/agg")
+                aggrega.labelAllNodes("aggregate")
+                aggrega.labelAllEdges("normal")
+                state["compute"], state["aggrega"] = compute, aggrega
+
+        def mst():
+                for edge in state["aggrega"].getMinimumSpanningTree():
+                        edge.label = "overlay"
+
+        def join():
+                state["joined"] = TopoJoiner.preferentialAttachment([
+                        ("com", state["compute"], None),
+                        ("agg", state["aggrega"], None),
+                ], label="overlay", scalar=0.5, method="grouped", rng=params["seed"])
+
+        def physical():
+                TopoJoiner.attachLayer(state["joined"], params["physical"], filter=set(["aggregate"]),
+                        name="phy_%d", labels=["physical"],
+                        prefixes=lambda i, name: ["/overlay/phy/%d" % (i % params["prefixes"])],
+                        distribution="rank", exponent=2.0, rng=params["seed"], label="overlay", capacity=1.0)
+
+        def routes():
+                r = IcnRoutes(state["joined"])
+                r.restrictPrefix("/direct", ["normal", "overlay"])
+                r.restrictPrefix("/overlay", ["overlay"])
+                r.calculateRoutes(processes=params["processes"])
+                state["routes"] = r
+
+        def exportTopology():
+                state["nodes"] = state["joined"].ExportTopology(
+                        os.path.join(params["workdir"], "nodes.txt"),
+                        os.path.join(params["workdir"], "edges.txt"),
+                )
+
+        def exportRoutes():
+                state["routes"].exportroutingtables(
+                        state["nodes"], os.path.join(params["workdir"], "routes.txt")
+                )
+
+        for name, function in zip(STAGES, [importLayers, mst, join, physical, routes, exportTopology, exportRoutes]):
+                stage(name, function)
+        return len(state["joined"].nodeSet), len(state["joined"].edgeSet), len(state["routes"].prefixes)
+
+def runScale(params, queue):
+        """ Child process body: runs the pipeline and sends its results, or
+            an {"error": ...} record naming the stage which raised
+        """
+        workdir = tempfile.mkdtemp()
+        params = dict(params, workdir=workdir)
+        results = []
+        def record(stage, seconds, memory):
+                results.append(dict(memory, stage=stage, seconds=seconds))
+        try:
+                stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+                try:
+                        nodes, edges, prefixes = pipeline(params, record)
+                finally:
+                        sys.stdout.close()
+                        sys.stdout = stdout
+                for r in results:
+                        r.update(nodes=nodes, edges=edges, prefixes=prefixes)
+                queue.put(results)
+        except BaseException as e:
+                stage = STAGES[len(results)] if len(results) < len(STAGES) else None
+                queue.put({"error": "%s: %s" % (type(e).__name__, e), "stage": stage})
+        finally:
+                shutil.rmtree(workdir)
+
+def collect(child, queue, poll=1.0):
+        """ Returns what the child put on the queue, or an error record if
+            it exits without sending anything
+        """
+        while True:
+                try:
+                        return queue.get(timeout=poll)
+                except Queue.Empty:
+                        if not child.is_alive():
+                                break
+        # the child may have sent its results just before exiting
+        try:
+                return queue.get(timeout=poll)
+        except Queue.Empty:
+                return {"error": "worker exited with code %s" % child.exitcode, "stage": None}
+
+def scaled(args, scale):
+        """ Returns the pipeline parameters for one point of the sweep
+        """
+        physical = max(1, int(args.physical * scale))
+        return {
+                "scale": scale,
+                "compute": args.compute,
+                "aggregate": max(args.attach + 1, int(args.aggregate * scale)),
+                "attach": args.attach,
+                "physical": physical,
+                "prefixes": max(1, int(args.prefixes * scale)) if args.prefixes else physical,
+                "processes": args.processes,
+                "seed": args.seed,
+        }
+
+def exponents(results):
+        """ Returns the least-squares slope of log(seconds) against
+            log(nodes) for each stage, i.e. its empirical scaling exponent
+        """
+        ret = {}
+        for stage in STAGES:
+                points = [
+                        (math.log(r["nodes"]), math.log(r["seconds"]))
+                        for r in results if r["stage"] == stage and r["seconds"] > 0
+                ]
+                if len(set(x for x, _ in points)) < 2:
+                        continue
+                mx = sum(x for x, _ in points) / len(points)
+                my = sum(y for _, y in points) / len(points)
+                ret[stage] = (
+                        sum((x - mx) * (y - my) for x, y in points) /
+                        sum((x - mx) ** 2 for x, _ in points)
+                )
+        return ret
+
+def compare(results, baseline, tolerance, minSeconds):
+        """ Prints the time of each stage relative to the baseline and
+            returns the number of stages slower than tolerance times it.
+            Stages faster than minSeconds in both runs are timer noise and
+            never count as regressions.
+        """
+        reference = {(b["scale"], b["stage"]): b for b in baseline}
+        regressions = 0
+        for r in results:
+                b = reference.get((r["scale"], r["stage"]))
+                if b == None or b["seconds"] <= 0:
+                        continue
+                ratio = r["seconds"] / b["seconds"]
+                flag = ""
+                if ratio > tolerance and max(r["seconds"], b["seconds"]) >= minSeconds:
+                        flag = "  REGRESSION"
+                        regressions += 1
+                print("%6s %-16s %8.3fs  x%.2f of baseline%s" % (r["scale"], r["stage"], r["seconds"], ratio, flag))
+        return regressions
+
+def main():
+        parser = argparse.ArgumentParser(description="Scaling benchmark for the topomux pipeline")
+        parser.add_argument("--compute", type=int, default=10, help="size of the compute full mesh")
+        parser.add_argument("--aggregate", type=int, default=100, help="nodes of the Barabasi-Albert aggregation layer")
+        parser.add_argument("--attach", type=int, default=2, help="edges added per Barabasi-Albert node")
+        parser.add_argument("--physical", type=int, default=1000, help="number of physical nodes")
+        parser.add_argument("--prefixes", type=int, default=0, help="distinct physical prefixes (default: one per node)")
+        parser.add_argument("--scales", default="0.25,0.5,1", help="comma separated size multipliers to sweep")
+        parser.add_argument("--processes", type=int, default=None, help="route worker processes")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="file to write the JSON results to")
+        parser.add_argument("--baseline", help="JSON results to compare against")
+        parser.add_argument("--tolerance", type=float, default=1.25, help="slowdown ratio reported as a regression")
+        parser.add_argument("--min-seconds", type=float, default=0.1, help="stages faster than this are not compared")
+        args = parser.parse_args()
+
+        results = []
+        failed = []
+        for scale in [float(x) for x in args.scales.split(",")]:
+                params = scaled(args, scale)
+                queue = multiprocessing.Queue()
+                child = multiprocessing.Process(target=runScale, args=(params, queue))
+                child.start()
+                rows = collect(child, queue)
+                child.join()
+                if isinstance(rows, dict):
+                        print("# scale %s failed in stage %s: %s" % (scale, rows["stage"], rows["error"]))
+                        failed.append(scale)
+                        continue
+                for row in rows:
+                        row.update(scale=scale, params=params)
+                        print(json.dumps(row, sort_keys=True))
+                results += rows
+
+        for stage, slope in sorted(exponents(results).items()):
+                print("# %-16s time ~ nodes^%.2f" % (stage, slope))
+
+        if args.output:
+                with open(args.output, "w") as f:
+                        json.dump(results, f, indent=1, sort_keys=True)
+
+        if args.baseline:
+                with open(args.baseline) as f:
+                        baseline = json.load(f)
+                if compare(results, baseline, args.tolerance, args.min_seconds):
+                        sys.exit(1)
+
+        if failed:
+                sys.exit(1)
+
+if __name__ == "__main__":
+        main()
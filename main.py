@@ -1,76 +1,92 @@
-from topomux import Topology, ImportedTopology, IcnRoutes, TopoJoiner
+from topomux import Topology, ImportedTopology, IcnRoutes, TopoJoiner, TopoCache
 from pprint import pprint
-import random
+import argparse, random
 import networkx as nx
 import fnss.topologies as ft
 
 def main():
+        parser = argparse.ArgumentParser(description="Builds a hierarchical ICN topology and its routing tables")
+        parser.add_argument("--seed", type=int, default=1, help="seed of the random layers and attachments")
+        parser.add_argument("--cache", default=".topomux-cache",
+                help="directory caching generated topologies and routes between runs, or \"\" for none")
+        args = parser.parse_args()
+        cache = TopoCache(args.cache) if args.cache else None
+        
+        # runs with the same seed and parameters load each stage's topology
+        # from the cache; stage keys chain the keys of their inputs
+        def stage(key, build):
+                return cache.memoizeTopology(key, build) if cache != None else build()
 
         # build computation layer
-        compute = ImportedTopology(ft.simplemodels.full_mesh_topology(10))
-        compute.prefixAllNodes("/direct/com")
-        compute.prefixAllNodes("/overlay/com")
-        compute.labelAllNodes("compute")
-        compute.labelAllEdges("compute")
+        def buildCompute():
+                compute = ImportedTopology(ft.simplemodels.full_mesh_topology(10))
+                compute.prefixAllNodes("/direct/com")
+                compute.prefixAllNodes("/overlay/com")
+                compute.labelAllNodes("compute")
+                compute.labelAllEdges("compute")
+                return compute
+        computeKey = TopoCache.key("compute", 10)
+        compute = stage(computeKey, buildCompute)
         
         # build aggregation layer
-        aggrega = ImportedTopology(ft.randmodels.barabasi_albert_topology(100, 2, 10))
-        aggrega.prefixAllNodes("/direct/agg")
-        aggrega.prefixAllNodes("/overlay/agg")
-        aggrega.labelAllNodes("aggregate")
-        aggrega.labelAllEdges("normal")
-        
-        # make MST edges in the aggration layer the overlay graph
-        for edge in aggrega.getMinimumSpanningTree():
-                edge.label = "overlay"
-        
-        # join the aggregation and computation layers
-        joined = TopoJoiner.preferentialAttachment([
-                ("com", compute, None),
-                ("agg", aggrega, None),
-        ], label="overlay", scalar=0.5)
-        
-        # create ordering of aggregation nodes based on degree
-        # we will connect physical nodes to the low-degree (i.e., edge)
-        # aggregate nodes
-        agg_nodes = sorted([x for x in joined.nodeSet if "aggregate" in x.labels], key=lambda x: x.getDegree())
+        def buildAggregate():
+                aggrega = ImportedTopology(ft.randmodels.barabasi_albert_topology(100, 2, 10, seed=args.seed))
+                aggrega.prefixAllNodes("/direct/agg")
+                aggrega.prefixAllNodes("/overlay/agg")
+                aggrega.labelAllNodes("aggregate")
+                aggrega.labelAllEdges("normal")
+                
+                # make MST edges in the aggration layer the overlay graph
+                for edge in aggrega.getMinimumSpanningTree():
+                        edge.label = "overlay"
+                return aggrega
+        aggregaKey = TopoCache.key("aggregate", 100, 2, 10, args.seed)
+        aggrega = stage(aggregaKey, buildAggregate)
         
-        # introduce physical layer
-        for i in xrange(0, 1000):
-                # create phy node
-                n = joined.addNode("phy_%d" % i, labels=["physical"])
-                n.addPrefix("/overlay/phy/%s" % n.name)
-
-                # choose agg node to connect to
-                a = agg_nodes[int(pow(random.random(), 2) * len(agg_nodes))]
-                joined.addEdge(n, a, label="overlay", capacity="1.0")
+        # join the aggregation and computation layers, then introduce the
+        # physical layer: we will connect physical nodes to the low-degree
+        # (i.e., edge) aggregate nodes
+        def buildJoined():
+                joined = TopoJoiner.preferentialAttachment([
+                        ("com", compute, None),
+                        ("agg", aggrega, None),
+                ], label="overlay", scalar=0.5, method="grouped", rng=args.seed)
+                TopoJoiner.attachLayer(joined, 1000, filter=set(["aggregate"]),
+                        name="phy_%d", labels=["physical"], prefixes=["/overlay/phy/%(name)s"],
+                        distribution="rank", exponent=2.0, rng=args.seed, label="overlay", capacity="1.0")
+                return joined
+        joined = stage(TopoCache.key("joined", computeKey, aggregaKey, 0.5, "grouped", 1000, 2.0, args.seed), buildJoined)
+        agg_nodes = joined.getNodesWithLabel("aggregate")
                 
         # find tentative routes
         t = IcnRoutes(joined)
         t.restrictPrefix("/direct", ["normal", "overlay"])
         t.restrictPrefix("/overlay", ["overlay"])
-        t.calculateRoutes()
+        t.calculateRoutes(cache=cache)
     
         # restrict agg nodes' shortest paths to com to urgent traffic
+        urgent = set()
         for n in agg_nodes:
-            face, cost = t.hops[n]["/direct/com"]
+            face, cost = t.route(n, "/direct/com")
             if face != None:
-                joined.getEdge(n, face).label = "urgent"
+                urgent.add(joined.getEdge(n, face))
+        changes = []
+        for edge in urgent:
+            changes.append((edge, edge.label))
+            edge.label = "urgent"
+        t.edgesLabelChanged(changes)
         
         # add urgent prefix to com nodes
-        for n in joined.nodeSet:
-            if "compute" in n.labels:
-                n.addPrefix("/urgent/com")
+        t.restrictPrefix("/urgent", ["normal", "overlay", "urgent"])
+        for n in joined.getNodesWithLabel("compute"):
+            n.addPrefix("/urgent/com")
+            t.prefixAdded(n, "/urgent/com")
         
         # export the network topology to a file
         allnodes = joined.ExportTopology()
               
-        # compute final routes
-        r = IcnRoutes(joined)
-        r.restrictPrefix("/urgent", ["normal", "overlay", "urgent"])
-        r.restrictPrefix("/direct", ["normal", "overlay"])
-        r.restrictPrefix("/overlay", ["overlay"])
-        r.calculateRoutes()
+        # the routes have been kept up to date with the final topology
+        r = t
        
         # ensure all prefixes are reachable from all nodes
         for node, pd in r.hops.items():
@@ -0,0 +1,50 @@
+import random, shutil, tempfile, unittest
+from topomux import IcnRoutes, Topology
+from topomux.TopoCache import TopoCache
+from tests.test_routes import randomTopology
+
+class TopoCacheTest (unittest.TestCase):
+
+        def setUp(self):
+                self.path = tempfile.mkdtemp()
+
+        def tearDown(self):
+                shutil.rmtree(self.path)
+
+        def testLoadRoutesLeavesTopology(self):
+                t = randomTopology(random.Random(3), 30, 60)
+                cache = TopoCache(self.path)
+                stored = IcnRoutes(t)
+                stored.calculateRoutes()
+                cache.storeRoutes(stored)
+
+                version = t.version
+                loaded = IcnRoutes(t)
+                self.assertTrue(cache.loadRoutes(loaded))
+                self.assertEqual(t.version, version)
+                self.assertEqual(dict(loaded.hops.items()), dict(stored.hops.items()))
+
+        def testMemoizeTopology(self):
+                t = randomTopology(random.Random(4), 30, 60)
+                cache = TopoCache(self.path)
+                built = []
+                def build():
+                        built.append(1)
+                        return t
+                key = TopoCache.key("layer", 4)
+                miss = cache.memoizeTopology(key, build)
+                hit = cache.memoizeTopology(key, build)
+                self.assertEqual(len(built), 1)
+                for topo in (miss, hit):
+                        self.assertIs(type(topo), Topology)
+                        self.assertEqual(TopoCache.topologyKey(topo), TopoCache.topologyKey(t))
+
+        def testEvictedEntry(self):
+                cache = TopoCache(self.path, maxBytes=10)
+                cache.put("a", b"x" * 8)
+                cache.put("b", b"y" * 8)
+                self.assertEqual(cache.get("a"), None)
+                self.assertEqual(cache.get("b"), b"y" * 8)
+
+if __name__ == "__main__":
+        unittest.main()
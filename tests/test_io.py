@@ -0,0 +1,57 @@
+import os, random, shutil, tempfile, unittest
+from topomux import Topology, IcnRoutes
+from tests.test_routes import randomTopology, calculate
+
+def plain(r):
+        """ Returns the routes of r keyed by node name
+        """
+        return {
+                (str(node), p): (None if face == None else str(face), cost)
+                for node, routes in r.hops.items() for p, (face, cost) in routes.items()
+        }
+
+class RouteTableIoTest (unittest.TestCase):
+
+        def setUp(self):
+                self.path = tempfile.mkdtemp()
+                t = randomTopology(random.Random(8), 40, 80)
+                t.addNode("isolated", prefixes=["/direct/com"])
+                self.routes = calculate(t, "dijkstra")
+                self.nodesFile = os.path.join(self.path, "nodes.txt")
+                self.edgesFile = os.path.join(self.path, "edges.txt")
+                self.nodes = t.ExportTopology(self.nodesFile, self.edgesFile)
+
+        def tearDown(self):
+                shutil.rmtree(self.path)
+
+        def load(self, f):
+                t, nodes = Topology.LoadTopology(self.nodesFile, self.edgesFile)
+                r = IcnRoutes(t)
+                r.importroutingtables(f, nodes)
+                return t, r
+
+        def testRoundTrip(self):
+                text = os.path.join(self.path, "routes.txt")
+                self.routes.exportroutingtables(self.nodes, text)
+                with open(text) as f:
+                        lines = f.readlines()
+
+                # a table reordered by node, and one in no order at all
+                byNode = os.path.join(self.path, "bynode.txt")
+                with open(byNode, "w") as f:
+                        f.writelines(sorted(lines, key=lambda x: (-int(x.split()[0]), x)))
+                shuffled = os.path.join(self.path, "shuffled.txt")
+                random.Random(1).shuffle(lines)
+                with open(shuffled, "w") as f:
+                        f.writelines(lines)
+                binary = os.path.join(self.path, "routes.bin")
+                self.routes.exportroutingtables(self.nodes, binary, format="binary")
+
+                servers = sorted((n.name, sorted(n.prefixes)) for n in self.routes.topo.getNodes())
+                for f in (text, byNode, shuffled, binary):
+                        t, r = self.load(f)
+                        self.assertEqual(plain(r), plain(self.routes), f)
+                        self.assertEqual(sorted((n.name, sorted(n.prefixes)) for n in t.getNodes()), servers, f)
+
+if __name__ == "__main__":
+        unittest.main()
@@ -0,0 +1,64 @@
+import math, random, unittest
+from topomux import Topology, TopoJoiner
+from tests.test_routes import randomTopology
+
+def fullMesh(n):
+        """ Returns a full mesh of n nodes
+        """
+        t = Topology()
+        nodes = [t.addNode("m%d" % i) for i in range(n)]
+        for i in range(n):
+                for j in range(i):
+                        t.addEdge(nodes[i], nodes[j])
+        return t
+
+class PreferentialAttachmentTest (unittest.TestCase):
+
+        def testMethodsDrawTheSameModel(self):
+                # a dense layer and a large scalar make many links per node,
+                # so degrees updated during the join would show
+                t1 = fullMesh(10)
+                t2 = randomTopology(random.Random(2), 40, 40)
+                edges = len(t1.getEdges()) + len(t2.getEdges())
+                scalar = 2.0
+                probability = lambda a, b: min(1.0, scalar / 2.0 * (a.getDegree() + b.getDegree()) / edges)
+                hub = max(t2.getNodes(), key=lambda b: (b.getDegree(), b.name))
+
+                # expected number and variance of the links, and of those of
+                # the highest-degree node of t2
+                pairs = [(a, b) for a in t1.getNodes() for b in t2.getNodes()]
+                mean = sum(probability(a, b) for a, b in pairs)
+                var = sum(probability(a, b) * (1 - probability(a, b)) for a, b in pairs)
+                hubMean = sum(probability(a, hub) for a in t1.getNodes())
+                hubVar = sum(probability(a, hub) * (1 - probability(a, hub)) for a in t1.getNodes())
+
+                runs = 300
+                for method in ("pairwise", "grouped"):
+                        total = hubTotal = 0
+                        for seed in range(runs):
+                                joined = TopoJoiner.preferentialAttachment(
+                                        [("a", t1, None), ("b", t2, None)], scalar=scalar, method=method, rng=seed
+                                )
+                                links = [e for e in joined.getEdges() if len(set(str(n)[0] for n in e.pair)) == 2]
+                                total += len(links)
+                                hubTotal += sum(1 for e in links if "b_" + hub.name in [str(n) for n in e.pair])
+
+                        # sample means stay within 4 standard errors
+                        self.assertLess(abs(float(total) / runs - mean), 4 * math.sqrt(var / runs), method)
+                        self.assertLess(abs(float(hubTotal) / runs - hubMean), 4 * math.sqrt(hubVar / runs), method)
+
+        def testSeedReproducesJoin(self):
+                t1 = randomTopology(random.Random(1), 30, 40)
+                t2 = randomTopology(random.Random(2), 20, 60)
+                for method in ("pairwise", "grouped"):
+                        a, b = [
+                                TopoJoiner.preferentialAttachment([("a", t1, None), ("b", t2, None)], method=method, rng=7)
+                                for _ in range(2)
+                        ]
+                        self.assertEqual(
+                                sorted(sorted(str(n) for n in e.pair) for e in a.getEdges()),
+                                sorted(sorted(str(n) for n in e.pair) for e in b.getEdges()),
+                        )
+
+if __name__ == "__main__":
+        unittest.main()
@@ -0,0 +1,235 @@
+import pickle, random, unittest
+from topomux import Topology, IcnName, IcnRoutes
+
+LABELS = ["normal", "overlay", "urgent", None]
+PREFIXES = ["/direct/com", "/direct/agg", "/overlay/com", "/overlay/agg", "/urgent/com", "/other"]
+
+def randomTopology(rng, n, m):
+        """ Returns a random topology of n nodes and about m edges with
+            random delays, edge labels and served prefixes
+        """
+        t = Topology()
+        nodes = [t.addNode("x%d" % i) for i in range(n)]
+        pairs = set()
+        for i in range(1, n):
+                if rng.random() < 0.9:
+                        pairs.add(frozenset([nodes[i], nodes[rng.randrange(i)]]))
+        for _ in range(m):
+                pairs.add(frozenset(rng.sample(nodes, 2)))
+        for pair in sorted(pairs, key=lambda x: sorted(str(n) for n in x)):
+                a, b = sorted(pair, key=str)
+                t.addEdge(a, b, delay=float(rng.randint(1, 5)), label=rng.choice(LABELS))
+        for node in nodes:
+                for p in PREFIXES:
+                        if rng.random() < 0.08:
+                                node.addPrefix(p)
+        return t
+
+def calculate(t, method):
+        """ Returns the routes of t calculated with the given engine, under
+            overlapping restrictions
+        """
+        r = IcnRoutes(t)
+        r.restrictPrefix("/direct", ["normal", "overlay"])
+        r.restrictPrefix("/overlay", ["overlay"])
+        r.restrictPrefix("/urgent", ["normal", "overlay", "urgent"])
+        r.restrictPrefix("/direct/agg", ["normal"])
+        r.calculateRoutes(method=method)
+        return r
+
+def randomEvent(rng, t, r):
+        """ Applies one random change to t and reports it to r through the
+            incremental update API
+        """
+        nodes = sorted(t.getNodes(), key=str)
+        kind = rng.choice(["relabel", "edge", "node", "addPrefix", "removePrefix", "restrict"])
+        if kind == "relabel":
+                edges = sorted(t.getEdges(), key=lambda e: sorted(str(n) for n in e.pair))
+                changes = []
+                for e in rng.sample(edges, rng.randint(1, 15)):
+                        changes.append((e, e.label))
+                        e.label = rng.choice(LABELS)
+                r.edgesLabelChanged(changes)
+        elif kind == "edge":
+                a = rng.choice(nodes)
+                b = rng.choice([n for n in nodes if n != a and not n in a.getNeighbors()] or [a])
+                if a != b:
+                        r.edgeAdded(t.addEdge(a, b, delay=float(rng.randint(1, 5)), label=rng.choice(LABELS)))
+        elif kind == "node":
+                prefixes = [p for p in PREFIXES + ["/late"] if rng.random() < 0.2]
+                a = t.addNode("late%d" % len(nodes), prefixes=prefixes)
+                r.edgeAdded(t.addEdge(a, rng.choice(nodes), delay=float(rng.randint(1, 5)), label=rng.choice(LABELS)))
+        elif kind == "addPrefix":
+                a, p = rng.choice(nodes), rng.choice(PREFIXES + ["/late"])
+                if not p in a.prefixes:
+                        a.addPrefix(p)
+                        r.prefixAdded(a, p)
+        elif kind == "removePrefix":
+                served = [(a, p) for a in nodes for p in sorted(a.prefixes)]
+                if served:
+                        a, p = rng.choice(served)
+                        a.removePrefix(p)
+                        r.prefixRemoved(a, p)
+        else:
+                r.restrictPrefix(rng.choice(["/direct", "/overlay", "/urgent", "/late"]),
+                        rng.sample(LABELS[:3], rng.randint(1, 3)))
+
+def nestedTopology(rng):
+        """ Returns a random topology serving random nested prefixes,
+            including an island of nodes whose prefixes are unreachable
+            from the rest
+        """
+        t = randomTopology(rng, 25, 35)
+        island = [t.addNode("island%d" % i) for i in range(3)]
+        t.addEdge(island[0], island[1], delay=1.0)
+        t.addEdge(island[1], island[2], delay=1.0)
+        names = ["/"] + ["/" + "/".join(rng.choice("abc") for _ in range(rng.randint(1, 3))) for _ in range(20)]
+        for node in t.getNodes():
+                for name in names:
+                        if rng.random() < (0.1 if node in island else 0.02):
+                                node.addPrefix(name)
+        return t
+
+def longestPrefixMatch(routes, name):
+        """ Returns the route of the longest of routes, a mapping from
+            prefix to (face, cost), which is a prefix of name, by brute force
+        """
+        match = None
+        for p in routes:
+                if IcnName(name).hasPrefix(p) and (match == None or len(IcnName.componentsOf(p)) > len(IcnName.componentsOf(match))):
+                        match = p
+        return None if match == None else routes[match]
+
+def forwarding(route):
+        """ Returns the forwarding decision of a route: its face, "local",
+            or None for no route and unreachable routes alike
+        """
+        if route == None or route[1] == None:
+                return None
+        return "local" if route[0] == None else route[0]
+
+class RouteEngineTest (unittest.TestCase):
+
+        def checkFaces(self, r):
+                """ Checks that every face is a neighbor on a path of the
+                    route's cost
+                """
+                for node, routes in r.hops.items():
+                        for p, (face, cost) in routes.items():
+                                if cost == None:
+                                        self.assertEqual(face, None)
+                                elif face == None:
+                                        self.assertIn(p, node.prefixes)
+                                        self.assertEqual(cost, 0.0)
+                                else:
+                                        delay = node.getNeighbors(r.getRestriction(p), delay=True, penalty=r.penalty)[face]
+                                        self.assertAlmostEqual(cost, delay + r.hops[face][p][1])
+
+        def testDijkstraMatchesSweep(self):
+                for seed in range(25):
+                        t = randomTopology(random.Random(seed), 40, 80)
+                        dijkstra, sweep = calculate(t, "dijkstra"), calculate(t, "sweep")
+                        for node in t.getNodes():
+                                for p in dijkstra.prefixes:
+                                        self.assertEqual(dijkstra.hops[node][p][1], sweep.hops[node][p][1],
+                                                "seed %d: %s -> %s" % (seed, node, p))
+                        self.checkFaces(dijkstra)
+                        self.checkFaces(sweep)
+
+        def testSweepOnSnapshot(self):
+                t = randomTopology(random.Random(5), 40, 80)
+                live = calculate(t, "dijkstra")
+                snapshot = pickle.loads(pickle.dumps(t.compact()))
+                for e in t.getEdges():
+                        e.delay = 1.0
+                r = calculate(snapshot, "sweep")
+                for node in t.getNodes():
+                        for p in live.prefixes:
+                                self.assertEqual(r.hops[node.name][p][1], live.hops[node][p][1])
+
+        def testParallelMatchesSerial(self):
+                t = randomTopology(random.Random(99), 60, 120)
+                serial = calculate(t, "dijkstra")
+                parallel = IcnRoutes(t)
+                for prefix, labels in serial.restrict.items():
+                        parallel.restrictPrefix(prefix, labels)
+                parallel.calculateRoutes(processes=2)
+                self.assertEqual(dict(serial.hops.items()), dict(parallel.hops.items()))
+
+        def testNodesAddedBeforeCalculation(self):
+                routes = {}
+                for method in ("dijkstra", "sweep"):
+                        t = randomTopology(random.Random(11), 30, 50)
+                        r = IcnRoutes(t)
+                        late = t.addNode("late")
+                        t.addEdge(late, t.getNode("x0"), delay=2.0)
+                        r.calculateRoutes(method=method)
+                        routes[method] = dict((str(n), dict((p, c) for p, (_, c) in r.hops[n].items())) for n in r.hops)
+                self.assertIn("late", routes["sweep"])
+                self.assertEqual(routes["dijkstra"], routes["sweep"])
+
+        def testUpdatesMatchRecalculation(self):
+                for seed in range(300):
+                        rng = random.Random(seed)
+                        t = randomTopology(rng, 25, 40)
+                        r = calculate(t, "dijkstra")
+                        for _ in range(rng.randint(1, 8)):
+                                randomEvent(rng, t, r)
+                        fresh = IcnRoutes(t)
+                        for prefix, labels in r.restrict.items():
+                                fresh.restrictPrefix(prefix, labels)
+                        fresh.calculateRoutes()
+                        self.assertEqual(r.prefixes, fresh.prefixes, "seed %d" % seed)
+                        for node in t.getNodes():
+                                for p in fresh.prefixes:
+                                        self.assertEqual(r.hops[node][p][1], fresh.hops[node][p][1],
+                                                "seed %d: %s -> %s" % (seed, node, p))
+                        self.checkFaces(r)
+
+        def testAggregatedForwarding(self):
+                synthesizedOverUnreachable = 0
+                for seed in range(40):
+                        rng = random.Random(seed)
+                        r = IcnRoutes(nestedTopology(rng))
+                        r.calculateRoutes()
+                        for synthesize in (False, True):
+                                fibs = r.aggregateRoutes(synthesize)
+                                for node in r.hops:
+                                        full = dict(r.hops[node].items())
+                                        fib = dict(fibs[node].items())
+                                        queries = set(full) | set(fib) | set(p + "/x" for p in full) | set(["/", "/z", "/a/z"])
+                                        for name in queries:
+                                                route = longestPrefixMatch(full, name)
+                                                # synthesized routes may forward names which had no route
+                                                if synthesize and route == None:
+                                                        continue
+                                                self.assertEqual(forwarding(fibs[node].longestMatch(name)), forwarding(route),
+                                                        "seed %d, synthesize %s: %s at %s" % (seed, synthesize, name, node))
+                                        # unreachable routes kept under a synthesized covering
+                                        # route which forwards
+                                        for p in fib:
+                                                covers = [q for q in fib if q != p and IcnName(p).hasPrefix(q)]
+                                                if fib[p][1] == None and covers:
+                                                        cover = max(covers, key=lambda q: len(IcnName.componentsOf(q)))
+                                                        if not cover in full and forwarding(fib[cover]) != None:
+                                                                synthesizedOverUnreachable += 1
+                self.assertTrue(synthesizedOverUnreachable > 0)
+
+        def testUnrestrictedPrefix(self):
+                t = randomTopology(random.Random(7), 40, 80)
+                plain = IcnRoutes(t)
+                plain.calculateRoutes()
+                for method in ("dijkstra", "sweep"):
+                        r = IcnRoutes(t)
+                        r.restrictPrefix("/", ["overlay"])
+                        r.restrictPrefix("/direct", None)
+                        r.calculateRoutes(method=method)
+                        self.assertEqual(r.getRestriction("/direct/com"), None)
+                        for node in t.getNodes():
+                                self.assertEqual(r.hops[node]["/direct/com"][1], plain.hops[node]["/direct/com"][1])
+                        r.restrictPrefix("/overlay", None)
+                        for node in t.getNodes():
+                                self.assertEqual(r.hops[node]["/overlay/com"][1], plain.hops[node]["/overlay/com"][1])
+
+if __name__ == "__main__":
+        unittest.main()
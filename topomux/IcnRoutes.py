@@ -1,79 +1,947 @@
+import collections, heapq, itertools, multiprocessing, time
+from array import array
+from Topology import Topology, CompactTopology
+from RouteTable import RouteTable, PrefixRoutes
+import TopoIO
+
 class IcnName (object):
         
         def __init__(self, components=[]):
-                if isinstance(components, str):
-                        components = components.split("/")
+                self.components = IcnName.componentsOf(components)
+        
+        @staticmethod
+        def componentsOf(name):
+                """ Returns the component list of a name given as a string,
+                    an IcnName or a sequence of components
+                """
+                if isinstance(name, IcnName):
+                        return name.components
+                if isinstance(name, str):
+                        components = name.split("/")
                         if components[0] == "":
                                 components = components[1:]
-                self.components = components
+                        if components == [""]:
+                                components = []
+                        return components
+                return list(name)
         
         def append(self, comp):
                 self.components.append(comp)
         
         def hasPrefix(self, prefix):
-                if not isinstance(prefix, IcnName):
-                        prefix = IcnName(prefix)
-                prefix = prefix.components[:]
-                
-                if len(prefix) > len(self.components):
-                        return False
-                
-                for a, b in zip(prefix, self.components):
-                        if a != b:
-                                return False
-                
-                return True
+                prefix = IcnName.componentsOf(prefix)
+                return self.components[:len(prefix)] == prefix
         
         def __str__(self):
                 return "/" + "/".join(self.components)
         
         def __repr__(self):
                 return self.__str__()
+
+
+class IcnNameTrie (object):
+        """
+        A trie over name components. Each trie node is a [children, isSet,
+        value] list; lookups walk the components of a name once and return
+        the value stored at its longest matching prefix.
+        """
+        
+        def __init__(self):
+                self.root = [{}, False, None]
+        
+        def insert(self, name, value):
+                """ Stores value under the given name
+                """
+                node = self.root
+                for c in IcnName.componentsOf(name):
+                        node = node[0].setdefault(c, [{}, False, None])
+                node[1], node[2] = True, value
+        
+        def longestMatch(self, name, default=None):
+                """ Returns the value stored under the longest prefix of name,
+                    or default if no prefix of name is in the trie
+                """
+                node = self.root
+                ret = node[2] if node[1] else default
+                for c in IcnName.componentsOf(name):
+                        node = node[0].get(c)
+                        if node == None:
+                                break
+                        if node[1]:
+                                ret = node[2]
+                return ret
+        
+        def items(self):
+                """ Returns the (name, value) pairs stored in the trie, in
+                    name order
+                """
+                ret = []
+                stack = [([], self.root)]
+                while stack:
+                        components, node = stack.pop()
+                        if node[1]:
+                                ret.append(("/" + "/".join(components), node[2]))
+                        for c, child in node[0].items():
+                                stack.append((components + [c], child))
+                return sorted(ret)
                 
 
+class RouteStats (object):
+        """
+        Counters filled in by IcnRoutes.calculateRoutes when passed one:
+        sweeps over all nodes (sweep engine) or shortest path searches
+        (dijkstra engine), relaxations attempted and applied, seconds spent
+        per prefix, in getNeighbors (sweep engine) or building the snapshot
+        (dijkstra engine), in getRestriction, and in total.
+        """
+        
+        def __init__(self):
+                self.sweeps = 0
+                self.searches = 0
+                self.relaxations = 0
+                self.applied = 0
+                self.prefixTime = {}
+                self.neighborTime = 0.0
+                self.snapshotTime = 0.0
+                self.restrictionTime = 0.0
+                self.totalTime = 0.0
+        
+        def timed(self, field, function):
+                """ Returns function wrapped to add the seconds spent in each
+                    call to the attribute named field
+                """
+                def wrapper(*args, **kwargs):
+                        start = time.time()
+                        try:
+                                return function(*args, **kwargs)
+                        finally:
+                                setattr(self, field, getattr(self, field) + time.time() - start)
+                return wrapper
+        
+        def merge(self, other):
+                """ Adds the counters of other to these
+                """
+                for field in ("sweeps", "searches", "relaxations", "applied",
+                              "neighborTime", "snapshotTime", "restrictionTime"):
+                        setattr(self, field, getattr(self, field) + getattr(other, field))
+                for p, seconds in other.prefixTime.items():
+                        self.prefixTime[p] = self.prefixTime.get(p, 0.0) + seconds
+        
+        def __str__(self):
+                slowest = sorted(self.prefixTime.items(), key=lambda x: -x[1])[:5]
+                return "\n".join([
+                        "total %.3fs, %d sweeps, %d searches" % (self.totalTime, self.sweeps, self.searches),
+                        "relaxations %d attempted, %d applied" % (self.relaxations, self.applied),
+                        "getNeighbors %.3fs, snapshot %.3fs, getRestriction %.3fs" % (
+                                self.neighborTime, self.snapshotTime, self.restrictionTime),
+                ] + ["  %s %.3fs" % x for x in slowest])
+
 class IcnRoutes (object):
+
+        # extra cost of crossing an edge outside a prefix's restriction
+        penalty = 1000.0
+        
+        # number of prefixes whose routes route() and routesFor() keep
+        # before the full table is calculated
+        cachedPrefixes = 64
                 
         def __init__(self, topo):
                 self.topo = topo
                 self.prefixes = topo.getPrefixes()
-                self.hops = {t: {p: (None, None) for p in self.prefixes} for t in topo.getNodes()}
+                self.hops = RouteTable(sorted(topo.getNodes(), key=str), self.prefixes)
                 self.restrict = {}
+                self._restrictTrie = IcnNameTrie()
+                self._restrictions = {}
+                self._routed = False
+                self._snapshot = None
+                self._lazy = collections.OrderedDict()
+                self._lazyVersion = None
+                self._lazySnapshot = None
      
         def restrictPrefix(self, prefix, labels):
+                """ Restricts names under prefix to edges with the given
+                    labels, or lifts any restriction inherited from a shorter
+                    prefix if labels is None. Once routes are calculated, the
+                    prefixes whose restriction changes are recomputed.
+                """
+                old = {p: self.getRestriction(p) for p in self.prefixes}
                 self.restrict[prefix] = labels
+                self._restrictTrie.insert(prefix, None if labels is None else frozenset(labels))
+                self._restrictions.clear()
+                self._snapshot = None
+                self._lazy.clear()
+                if self._routed:
+                        for p in self.prefixes:
+                                if self.getRestriction(p) != old[p]:
+                                        self._recompute(p)
         
         def getRestriction(self, name):
-                name = IcnName(name)
-                for p, l in self.restrict.items():
-                        if name.hasPrefix(p):
-                                return l
-                return None
+                """ Returns the set of edge labels allowed for name, taken from
+                    the longest restricted prefix of name, or None if name is
+                    unrestricted. Results for the routed prefixes are cached.
+                """
+                cacheable = isinstance(name, str) and name in self.prefixes
+                if cacheable and name in self._restrictions:
+                        return self._restrictions[name]
+                ret = self._restrictTrie.longestMatch(name)
+                if cacheable:
+                        self._restrictions[name] = ret
+                return ret
+        
+        def route(self, node, prefix):
+                """ Returns the (face, cost) route of node to prefix. Before
+                    calculateRoutes, only the routes to prefix are computed,
+                    see routesFor.
+                """
+                return self.routesFor(prefix)[node]
+        
+        def routesFor(self, prefix):
+                """ Returns a read-only mapping from each node to its (face,
+                    cost) route to prefix.
+                    
+                    Once calculateRoutes has run, this is a view of
+                    self.hops. Before, the shortest path tree of prefix alone
+                    is computed when first asked for and kept in a cache of
+                    the cachedPrefixes most recently used prefixes, which is
+                    cleared whenever the topology or the restrictions change.
+                """
+                if self._routed and prefix in self.prefixes:
+                        return self.hops.prefixRoutes(prefix)
+                
+                if self._lazyVersion != self.topo.version:
+                        self._lazy.clear()
+                        self._lazyVersion = self.topo.version
+                        self._lazySnapshot = None
+                if prefix in self._lazy:
+                        routes = self._lazy.pop(prefix)
+                        self._lazy[prefix] = routes
+                        return routes
+                
+                if self._lazySnapshot == None:
+                        snapshot = self.topo.compact()
+                        nodes = snapshot.getNodes()
+                        self._lazySnapshot = snapshot, nodes, {n: i for i, n in enumerate(nodes)}
+                snapshot, nodes, index = self._lazySnapshot
+                faces, costs = snapshot.shortestPaths(
+                        snapshot.getServers(prefix),
+                        snapshot.getLabelIds(self.getRestriction(prefix)),
+                        self.penalty,
+                )
+                faces, costs = RouteTable.toColumn(faces, costs)
+                routes = PrefixRoutes(nodes, index, faces, costs)
+                self._lazy[prefix] = routes
+                while len(self._lazy) > self.cachedPrefixes:
+                        self._lazy.popitem(last=False)
+                return routes
         
-        def calculateRoutes(self):
+        def calculateRoutes(self, method="dijkstra", processes=None, cache=None, stats=None, progress=None):
+                """ Fills self.hops with a (face, cost) pair for every node and
+                    prefix. method selects the route engine: "dijkstra" runs
+                    one multi-source shortest path search per prefix over a
+                    CompactTopology snapshot, "sweep" relaxes every node's
+                    routes until nothing changes.
+                    
+                    If processes is greater than one, the dijkstra searches
+                    are spread over a pool of that many worker processes;
+                    the results are the same as those of a serial run.
+                    
+                    cache may be a TopoCache; routes of a topology and
+                    restrictions seen before are then loaded from it, and
+                    new ones are stored in it.
+                    
+                    stats may be a RouteStats to fill in. progress may be a
+                    function called as progress(done, total) as the work
+                    advances: done counts prefixes routed by the dijkstra
+                    engine and sweeps of the sweep engine, whose total is
+                    the node count, an upper bound on the sweeps needed;
+                    done reaches total once the sweeps converge.
+                """
+                engines = {
+                        "dijkstra": self._calculateDijkstra,
+                        "sweep": self._calculateSweep,
+                }
+                if method not in engines:
+                        raise ValueError("unknown route engine: %r" % (method,))
+                parallel = processes != None and processes > 1
+                if parallel and method != "dijkstra":
+                        raise ValueError("the %s engine cannot use processes" % (method,))
+                start = time.time()
+                if cache != None and cache.loadRoutes(self):
+                        self._routed = True
+                        if progress != None:
+                                progress(len(self.prefixes), len(self.prefixes))
+                        return
+                if parallel:
+                        self._calculateDijkstra(processes, stats, progress)
+                else:
+                        engines[method](stats=stats, progress=progress)
+                self._routed = True
+                if cache != None:
+                        cache.storeRoutes(self)
+                if stats != None:
+                        stats.totalTime += time.time() - start
+
+        def _calculateDijkstra(self, processes=None, stats=None, progress=None):
+                if stats != None:
+                        start = time.time()
+                        snapshot = self.topo.compact()
+                        stats.snapshotTime += time.time() - start
+                        restriction = stats.timed("restrictionTime", self.getRestriction)
+                else:
+                        snapshot = self.topo.compact()
+                        restriction = self.getRestriction
+                nodes = snapshot.getNodes()
+                jobs = [
+                        (p, snapshot.getLabelIds(restriction(p)), stats != None)
+                        for p in self.prefixes
+                ]
+                
+                if processes != None and processes > 1:
+                        pool = multiprocessing.Pool(processes, _initWorker, (snapshot, self.penalty))
+                        try:
+                                done = 0
+                                for p, faces, costs, jobStats in pool.imap_unordered(_routePrefix, jobs):
+                                        self._storeRoutes(nodes, p, faces, costs)
+                                        if stats != None:
+                                                stats.merge(jobStats)
+                                        done += 1
+                                        if progress != None:
+                                                progress(done, len(jobs))
+                        finally:
+                                pool.terminate()
+                                pool.join()
+                        return
+                
+                for done, (p, allowed, _) in enumerate(jobs):
+                        if stats != None:
+                                start = time.time()
+                                faces, costs = snapshot.shortestPaths(snapshot.getServers(p), allowed, self.penalty, stats)
+                                stats.searches += 1
+                                stats.prefixTime[p] = time.time() - start
+                        else:
+                                faces, costs = snapshot.shortestPaths(snapshot.getServers(p), allowed, self.penalty)
+                        self._storeRoutes(nodes, p, faces, costs)
+                        if progress != None:
+                                progress(done + 1, len(jobs))
+        
+        def _storeRoutes(self, nodes, p, faces, costs):
+                """ Copies the result of CompactTopology.shortestPaths for
+                    prefix p into self.hops. Nodes added to the topology
+                    since the table was built get a row first.
+                """
+                self._addRows(nodes)
+                self.hops.setColumn(p, nodes, faces, costs)
+
+        def _addRows(self, nodes):
+                """ Gives the nodes which have no row in self.hops, i.e. were
+                    added to the topology since the table was built, a row
+                    of unreachable routes
+                """
+                if len(nodes) > len(self.hops):
+                        for node in nodes:
+                                if not node in self.hops:
+                                        self.hops.addNode(node)
+
+        def _calculateSweep(self, stats=None, progress=None):
+                self._addRows(self.topo.getNodes())
+                restriction = self.getRestriction
+                if stats != None:
+                        restriction = stats.timed("restrictionTime", restriction)
+                if isinstance(self.topo, CompactTopology):
+                        near, allowed = self._snapshotNeighbors()
+                else:
+                        near, allowed = self._topologyNeighbors()
+                if stats != None:
+                        near = stats.timed("neighborTime", near)
 
                 # if a node serves a prefix, it can reach that prefix in zero hops
-                for node in self.topo.getNodes():
-                        for prefix in node.prefixes:
-                                self.hops[node][prefix] = (None, 0.0)
+                table = self.hops
+                for prefix in self.prefixes:
+                        for node in self.topo.getNodesWithPrefix(prefix):
+                                table.set(node, prefix, None, 0.0)
                 
                 # visit each node and propagate its prefix to its neighbors
+                columns = [
+                        (p, table.faces[p], table.costs[p], allowed(restriction(p)))
+                        for p in table.getPrefixes()
+                ]
                 change = True
+                applied = sweeps = 0
                 while change:
                         change = False
-                        for a in self.hops:
-                                for p, (face, dist) in self.hops[a].items():
-                                        for b, delay in a.getNeighbors(self.getRestriction(p), delay=True, penalty=1000.0).items():
-                                                if dist != None and (self.hops[b][p][1] == None or self.hops[b][p][1] > dist + delay):
-                                                        self.hops[b][p] = (a, dist + delay)
+                        for i in range(len(table)):
+                                for p, faces, costs, labels in columns:
+                                        if stats != None:
+                                                start = time.time()
+                                        dist = costs[i]
+                                        edges = near(i, labels)
+                                        for k, delay in edges:
+                                                if dist == dist and not costs[k] <= dist + delay:
+                                                        faces[k], costs[k] = i, dist + delay
                                                         change = True
+                                                        applied += 1
+                                        if stats != None:
+                                                if dist == dist:
+                                                        stats.relaxations += len(edges)
+                                                stats.prefixTime[p] = stats.prefixTime.get(p, 0.0) + time.time() - start
+                        sweeps += 1
+                        if progress != None:
+                                progress(len(table) if not change else min(sweeps, len(table) - 1), len(table))
+                if stats != None:
+                        stats.sweeps += sweeps
+                        stats.applied += applied
+
+        def _topologyNeighbors(self):
+                """ Returns the (near, allowed) functions of the sweep over a
+                    mutable Topology: near(i, labels) lists the (position,
+                    delay) pairs of the neighbors of the node at position i
+                    of self.hops, and allowed turns a restriction into the
+                    labels near expects
+                """
+                neighbors = Topology.Node.getNeighbors
+                nodes, index, penalty = self.hops.nodes, self.hops.index, self.penalty
+                def near(i, labels):
+                        return [
+                                (index[b], delay)
+                                for b, delay in neighbors(nodes[i], labels, delay=True, penalty=penalty).items()
+                        ]
+                return near, lambda labels: labels
+
+        def _snapshotNeighbors(self):
+                """ Returns the (near, allowed) functions of the sweep over a
+                    CompactTopology, as _topologyNeighbors does, reading its
+                    adjacency arrays; every half-edge is a separate entry
+                """
+                snapshot = self.topo
+                offsets, neighbors = snapshot.offsets, snapshot.neighbors
+                delays, edgeLabels = snapshot.neighborDelays, snapshot.neighborLabels
+                index, penalty = self.hops.index, self.penalty
+                position = [index[n] for n in snapshot.getNodes()]
+                ids = [0] * len(position)
+                for a, i in enumerate(position):
+                        ids[i] = a
+                def near(i, labels):
+                        a = ids[i]
+                        ret = []
+                        for k in range(offsets[a], offsets[a + 1]):
+                                delay = delays[k]
+                                if labels != None and not edgeLabels[k] in labels:
+                                        delay += penalty
+                                ret.append((position[neighbors[k]], delay))
+                        return ret
+                return near, snapshot.getLabelIds
+
+        def edgeLabelChanged(self, edge, oldLabel):
+                """ Updates the routes after edge was relabelled from
+                    oldLabel; only prefixes whose restriction treats the two
+                    labels differently are touched
+                """
+                self.edgesLabelChanged([(edge, oldLabel)])
+        
+        def edgesLabelChanged(self, changes):
+                """ Updates the routes after several edges were relabelled.
+                    changes holds (edge, oldLabel) pairs; each affected
+                    prefix is repaired once for the whole batch.
+                    
+                    The first affected prefixes estimate what repairs cost:
+                    once most of them had to recompute their whole tree,
+                    the rest of the batch is recomputed from the shared
+                    snapshot without attempting a repair first.
+                """
+                self._beginUpdate()
+                changes = list(changes)
+                repaired = recomputed = 0
+                for p in sorted(self.prefixes):
+                        allowed = self.getRestriction(p)
+                        if allowed == None:
+                                continue
+                        edges = [e for e, old in changes if (old in allowed) != (e.label in allowed)]
+                        if not edges:
+                                continue
+                        if repaired >= 4 and recomputed * 2 > repaired:
+                                self._recompute(p)
+                                continue
+                        repaired += 1
+                        if self._edgesChanged(p, edges):
+                                recomputed += 1
+        
+        def edgeAdded(self, edge):
+                """ Updates the routes after edge was added to the topology.
+                    Endpoints which are new to the topology get routes too.
+                """
+                self._beginUpdate()
+                added = [n for n in edge.pair if not n in self.hops]
+                for node in added:
+                        self.hops.addNode(node)
+                for node in added:
+                        for p in node.prefixes:
+                                self.prefixAdded(node, p)
+                for p in self.prefixes:
+                        self._edgesChanged(p, [edge])
+        
+        def prefixAdded(self, node, prefix):
+                """ Updates the routes after node started serving prefix
+                """
+                self._beginUpdate()
+                if not node in self.hops:
+                        self.hops.addNode(node)
+                if not prefix in self.prefixes:
+                        self.prefixes.add(prefix)
+                        self.hops.addPrefix(prefix)
+                        self._recompute(prefix)
+                elif self._routed:
+                        self._relax(prefix, [(0.0, node, None)])
+        
+        def prefixRemoved(self, node, prefix):
+                """ Updates the routes after node stopped serving prefix;
+                    prefixes no node serves any more are dropped
+                """
+                self._beginUpdate()
+                if not self.topo.getNodesWithPrefix(prefix):
+                        self.prefixes.discard(prefix)
+                        self.hops.removePrefix(prefix)
+                elif self._routed:
+                        self._rebuildSubtrees(prefix, [node])
+        
+        def _beginUpdate(self):
+                """ Prepares for an update after the topology changed
+                """
+                if isinstance(self.topo, CompactTopology):
+                        raise TypeError("routes over a CompactTopology cannot be updated")
+                self._snapshot = None
+        
+        def _weights(self, node, p):
+                """ Returns the cost of reaching each neighbor of node for
+                    prefix p
+                """
+                return node.getNeighbors(self.getRestriction(p), delay=True, penalty=self.penalty)
+        
+        def _recompute(self, p):
+                """ Recomputes the routes of prefix p from scratch, over a
+                    snapshot shared by all prefixes of the current update
+                """
+                if not self._routed:
+                        return
+                if self._snapshot == None:
+                        self._snapshot = self.topo.compact()
+                snapshot = self._snapshot
+                faces, costs = snapshot.shortestPaths(
+                        snapshot.getServers(p),
+                        snapshot.getLabelIds(self.getRestriction(p)),
+                        self.penalty,
+                )
+                self._storeRoutes(snapshot.getNodes(), p, faces, costs)
+        
+        def _relax(self, p, seeds):
+                """ Dijkstra search for prefix p which only lowers existing
+                    costs, starting from seeds, a list of (cost, node, face)
+                    candidate routes
+                """
+                index = self.hops.index
+                faces, costs = self.hops.column(p)
+                counter = itertools.count()
+                heap = [(c, next(counter), n, f) for c, n, f in seeds]
+                heapq.heapify(heap)
+                while heap:
+                        dist, _, a, face = heapq.heappop(heap)
+                        i = index[a]
+                        if costs[i] <= dist:
+                                continue
+                        faces[i], costs[i] = -1 if face == None else index[face], dist
+                        for b, delay in self._weights(a, p).items():
+                                if not costs[index[b]] <= dist + delay:
+                                        heapq.heappush(heap, (dist + delay, next(counter), b, a))
+        
+        def _rebuildSubtrees(self, p, roots):
+                """ Discards the routes of p at the roots and every node
+                    whose route passes through them, then recomputes those
+                    routes from the surrounding nodes. Returns True if the
+                    subtrees were too large and the whole tree was
+                    recomputed instead.
+                """
+                # the nodes routing through n are the neighbors using it as
+                # their face, so the subtrees are found without a full scan;
+                # repairing much of the tree costs more than rebuilding it
+                index = self.hops.index
+                faces, costs = self.hops.column(p)
+                affected = set()
+                stack = list(roots)
+                while stack:
+                        n = stack.pop()
+                        if not n in affected:
+                                affected.add(n)
+                                if len(affected) * 4 > len(self.hops):
+                                        self._recompute(p)
+                                        return True
+                                i = index[n]
+                                stack.extend(m for m in n.getNeighbors() if faces[index[m]] == i)
+                
+                for n in affected:
+                        faces[index[n]], costs[index[n]] = -1, float('nan')
+                
+                seeds = []
+                for n in affected:
+                        if p in n.prefixes:
+                                seeds.append((0.0, n, None))
+                                continue
+                        for m, delay in self._weights(n, p).items():
+                                cost = costs[index[m]]
+                                if cost == cost:
+                                        seeds.append((cost + delay, n, m))
+                self._relax(p, seeds)
+                return False
+        
+        def _edgesChanged(self, p, edges):
+                """ Repairs the routes of p after the cost of edges changed.
+                    Returns True if the whole tree of p was recomputed.
+                """
+                if not self._routed:
+                        return False
+                ends = []
+                for edge in edges:
+                        i = iter(edge.pair)
+                        a = next(i)
+                        b = next(i, a)
+                        ends += [(a, b), (b, a)]
+                
+                # routes using the edges may have become more expensive
+                route = self.hops.route
+                roots = [x for x, y in ends if route(x, p)[0] is y]
+                if roots and self._rebuildSubtrees(p, roots):
+                        return True
+                
+                # routes across the edges may have become cheaper
+                seeds = []
+                for x, y in ends:
+                        cost = route(x, p)[1]
+                        delay = self._weights(x, p).get(y)
+                        if cost != None and delay != None:
+                                seeds.append((cost + delay, y, x))
+                self._relax(p, seeds)
+                return False
 
-        def exportroutingtables(self, nodes):
+        def aggregateRoutes(self, synthesize=False):
+                """ Returns a FIB for every node: an IcnNameTrie mapping
+                    prefixes to (face, cost) routes, holding only the routes
+                    longest prefix matching cannot do without. A route is
+                    dropped when the nearest covering route has the same
+                    face, or when no route covers it and it is unreachable,
+                    so every routed prefix is still forwarded as before.
+                    
+                    If synthesize is True, covering routes are also created
+                    for inner names no prefix covers, including the default
+                    route "/", where most of the routes below share a face.
+                    Names which had no route may then be forwarded too.
+                """
+                fibs = {}
+                for node, entries in zip(self.hops.nodes, self._aggregate(synthesize)):
+                        fib = fibs[node] = IcnNameTrie()
+                        for p, face, cost in entries:
+                                fib.insert(p, (
+                                        None if face == -1 else self.hops.nodes[face],
+                                        None if cost != cost else cost,
+                                ))
+                return fibs
+        
+        def _aggregate(self, synthesize=False):
+                """ Returns the entries aggregateRoutes keeps for each node,
+                    in table order, as lists of (prefix, face, cost) sorted
+                    by prefix, with faces as table positions
+                """
+                table = self.hops
+                names = {tuple(IcnName.componentsOf(p)): p for p in self.prefixes}
+                
+                # inner vertices of the name tree not covered by any prefix
+                # can carry synthesized routes
+                inner = set()
+                if synthesize:
+                        for c in names:
+                                for j in range(len(c)):
+                                        if c[:j] in names:
+                                                break
+                                        inner.add(c[:j])
+                for v in inner:
+                        names[v] = "/" + "/".join(v)
+                
+                # the nearest covering vertex of each vertex
+                parent = {}
+                for c in names:
+                        parent[c] = None
+                        for j in range(len(c) - 1, -1, -1):
+                                if c[:j] in names:
+                                        parent[c] = c[:j]
+                                        break
+                children = {v: [] for v in inner}
+                for c, v in parent.items():
+                        if v in inner:
+                                children[v].append(c)
+                bottomUp = sorted(inner, key=len, reverse=True)
+                topDown = sorted(names, key=len)
+                columns = [(c, table.faces[names[c]], table.costs[names[c]]) for c in names if not c in inner]
+                
+                ret = []
+                for k in range(len(table)):
+                        # routes are compared by face, with -2 for no route
+                        face, cost = {}, {}
+                        for c, faces, costs in columns:
+                                face[c] = faces[k] if costs[k] == costs[k] else -2
+                                cost[c] = costs[k]
+                        
+                        # a covering route pays off if it replaces more routes
+                        # than it adds, counting the unreachable ones it hides
+                        for v in bottomUp:
+                                below = [face[c] for c in children[v] if c in face]
+                                counts = {}
+                                for x in below:
+                                        if x != -2:
+                                                counts[x] = counts.get(x, 0) + 1
+                                if not counts:
+                                        continue
+                                best = min(counts, key=lambda x: (-counts[x], x))
+                                if counts[best] > 1 + below.count(-2):
+                                        face[v] = best
+                                        cost[v] = min(cost[c] for c in children[v] if face.get(c) == best)
+                        
+                        entries = []
+                        for c in topDown:
+                                if not c in face:
+                                        continue
+                                v = parent[c]
+                                while v != None and not v in face:
+                                        v = parent[v]
+                                if face[c] != (-2 if v == None else face[v]):
+                                        entries.append((names[c], -1 if face[c] == -2 else face[c], cost[c]))
+                        entries.sort()
+                        ret.append(entries)
+                return ret
+
+        def exportroutingtables(self, nodes=None, f="icens-routing-tables.txt", format="text", aggregate=False, synthesize=False):
+                """ Exports the routing table of every node to f, a path or a
+                    file object. nodes is the list of node names returned by
+                    ExportTopology, which assigns the node ids; if it is None
+                    the nodes are numbered in name order.
+                    
+                    The "text" format has one "id prefix face cost" line per
+                    node and prefix, where face is a node id or "local". The
+                    "binary" format is described in TopoIO.writeRouteTable.
+                    Paths ending in ".gz" are compressed.
+                    
+                    If aggregate is True, the text table only holds the
+                    routes kept by aggregateRoutes(synthesize), which give
+                    the same longest prefix match forwarding. Such tables
+                    cannot be imported back.
+                """
+                if not format in ("text", "binary"):
+                        raise ValueError("unknown routing table format: %r" % (format,))
+                if aggregate and format != "text":
+                        raise ValueError("aggregated routing tables are text only")
+                if nodes == None:
+                        nodes = sorted(str(n) for n in self.hops)
+                ids = {name: i for i, name in enumerate(nodes)}
+                prefixes = sorted(self.prefixes)
+                table = self.hops
+                exportIds = [ids[str(n)] for n in table.nodes]
+                rows = sorted((i, k) for k, i in enumerate(exportIds))
+                columns = [(p, table.faces[p], table.costs[p]) for p in prefixes]
+                
                 # export the routing table for all nodes
-                print "Exporting routing table to file (icens-routing-tables.txt) !!!!!"
-                                
-                f = open("icens-routing-tables.txt","w")
-                for n in self.hops:
-                        for p, (face, dist) in self.hops[n].items():
-                                f.write(str(nodes.index(str(n))) + " " + str(p) + " " +  str( "local" if str(face)=="None" else nodes.index(str(face)) ) + " " + str(dist) + "\n")
-                f.close()
+                print "Exporting routing table to file (%s) !!!!!" % TopoIO.fileName(f)
+                
+                if format == "binary":
+                        with TopoIO.openFile(f, "wb") as out:
+                                self._writeBinary(out, nodes)
+                        return
+                
+                if aggregate:
+                        fibs = self._aggregate(synthesize)
+                        with TopoIO.openFile(f, "w") as out:
+                                TopoIO.writeLines(out, (
+                                        "%d %s %s %s\n" % (
+                                                i, p,
+                                                "local" if face == -1 else exportIds[face],
+                                                None if cost != cost else cost,
+                                        )
+                                        for i, k in rows
+                                        for p, face, cost in fibs[k]
+                                ))
+                        return
+                
+                with TopoIO.openFile(f, "w") as out:
+                        TopoIO.writeLines(out, (
+                                "%d %s %s %s\n" % (
+                                        i, p,
+                                        "local" if faces[k] == -1 else exportIds[faces[k]],
+                                        None if costs[k] != costs[k] else costs[k],
+                                )
+                                for i, k in rows
+                                for p, faces, costs in columns
+                        ))
+
+
+        def _writeBinary(self, f, nodes):
+                """ Writes the routing tables in the binary format to the file
+                    object f, numbering the nodes by their index in nodes
+                """
+                ids = {name: i for i, name in enumerate(nodes)}
+                table = self.hops
+                exportIds = [ids[str(n)] for n in table.nodes]
+                prefixes = sorted(self.prefixes)
+                
+                # columns are written as they are stored when the table
+                # numbers the nodes as nodes does
+                if exportIds == list(range(len(nodes))):
+                        TopoIO.writeRouteTable(f, len(nodes), prefixes, [table.column(p) for p in prefixes])
+                        return
+                columns = []
+                for p in prefixes:
+                        own, ownCosts = table.column(p)
+                        faces = array('i', [-1]) * len(nodes)
+                        costs = array('d', [float('nan')]) * len(nodes)
+                        for k, i in enumerate(exportIds):
+                                if own[k] != -1:
+                                        faces[i] = exportIds[own[k]]
+                                costs[i] = ownCosts[k]
+                        columns.append((faces, costs))
+                TopoIO.writeRouteTable(f, len(nodes), prefixes, columns)
+        
+        def importroutingtables(self, f="icens-routing-tables.txt", nodes=None, markServing=True):
+                """ Fills self.hops from a routing table written by
+                    exportroutingtables, in either format, given as a path
+                    or a file object. nodes is the list of node names
+                    indexed by node id, as returned by Topology.LoadTopology;
+                    if it is None the nodes are numbered in name order.
+                    
+                    Prefixes found in the table are added to self.prefixes.
+                    If markServing is set and the topology is not a
+                    CompactTopology, nodes with a local zero-cost route to a
+                    prefix are marked as serving it, since the topology files
+                    do not record prefixes. Callers whose topology already
+                    has its prefixes, such as TopoCache, should clear it so
+                    the topology is left untouched.
+                """
+                with TopoIO.openFile(f, "rb") as fh:
+                        data = fh.read()
+                
+                handles = {str(n): n for n in self.hops}
+                if nodes == None:
+                        nodes = sorted(handles)
+                byId = [handles[x] for x in nodes]
+                serving = markServing and not isinstance(self.topo, CompactTopology)
+                
+                if data[:len(TopoIO.ROUTES_MAGIC)] == TopoIO.ROUTES_MAGIC:
+                        _, prefixes, columns = TopoIO.readRouteTable(data)
+                        self._addPrefixes(prefixes)
+                        for p, (faces, costs) in zip(prefixes, columns):
+                                self.hops.setColumn(p, byId, faces, costs)
+                                if serving:
+                                        for i, node in enumerate(byId):
+                                                if faces[i] == -1 and costs[i] == 0.0:
+                                                        node.addPrefix(p)
+                        return
+                
+                # text tables are parsed column-wise from the whitespace
+                # separated fields of the whole file; tables laid out as
+                # exportroutingtables writes them are stored a prefix at a
+                # time, others a route at a time
+                fields = data.split()
+                ids, prefixes, faces, costs = fields[0::4], fields[1::4], fields[2::4], fields[3::4]
+                self._addPrefixes(set(prefixes))
+                if self._importColumns(byId, ids, prefixes, faces, costs, serving):
+                        return
+                byName = {str(i): n for i, n in enumerate(byId)}
+                byName["local"] = None
+                values = {c: float(c) for c in set(costs) if c != "None"}
+                values["None"] = None
+                route = self.hops.set
+                for i, p, face, cost in zip(ids, prefixes, faces, costs):
+                        node = byName[i]
+                        route(node, p, byName[face], values[cost])
+                        if serving and face == "local" and values[cost] == 0.0:
+                                node.addPrefix(p)
+        
+        def _importColumns(self, byId, ids, prefixes, faces, costs, serving):
+                """ Stores the routes of a text routing table, given as the
+                    lists of its fields, with one setColumn call per prefix.
+                    This needs the table to list the same prefixes in the
+                    same order for every node of self.hops, once each;
+                    returns False, storing nothing, for any other layout.
+                """
+                table = self.hops
+                width = len(set(prefixes))
+                if width == 0 or len(prefixes) != width * len(table):
+                        return False
+                names = prefixes[:width]
+                if len(set(names)) != width or any(prefixes[j::width].count(p) != len(table) for j, p in enumerate(names)):
+                        return False
+                rows = ids[0::width]
+                if any(ids[j::width] != rows for j in range(1, width)):
+                        return False
+                
+                # order[k] is the row of the node at position k of the table,
+                # and faces are translated from node ids to table positions
+                try:
+                        nodes = [byId[int(i)] for i in rows]
+                except (ValueError, IndexError):
+                        return False
+                if len(set(nodes)) != len(table):
+                        return False
+                faceIds = {str(i): table.index[node] for i, node in enumerate(byId)}
+                faceIds["local"] = -1
+                order = [0] * len(table)
+                for k, node in enumerate(nodes):
+                        order[table.index[node]] = k
+                if order == range(len(order)):
+                        order = None
+                values = {c: float('nan') if c == "None" else float(c) for c in set(costs)}
+                
+                for j, p in enumerate(names):
+                        columnFaces, columnCosts = faces[j::width], costs[j::width]
+                        if order != None:
+                                columnFaces = map(columnFaces.__getitem__, order)
+                                columnCosts = map(columnCosts.__getitem__, order)
+                        table.setColumn(p, table.nodes,
+                                array('i', map(faceIds.__getitem__, columnFaces)),
+                                array('d', map(values.__getitem__, columnCosts)),
+                        )
+                        if serving:
+                                # local routes are few: servers and unreachable nodes
+                                k = -1
+                                while True:
+                                        try:
+                                                k = columnFaces.index("local", k + 1)
+                                        except ValueError:
+                                                break
+                                        if values[columnCosts[k]] == 0.0:
+                                                table.nodes[k].addPrefix(p)
+                return True
+        
+        def _addPrefixes(self, prefixes):
+                """ Adds routes to unknown prefixes to every node, initially
+                    unreachable
+                """
+                for p in prefixes:
+                        if not p in self.prefixes:
+                                self.prefixes.add(p)
+                                self.hops.addPrefix(p)
+
+
+# snapshot and penalty used by the route worker processes; set once per
+# worker by the pool initializer so the topology is not sent with each job
+_worker = {}
+
+def _initWorker(snapshot, penalty):
+        _worker["snapshot"] = snapshot
+        _worker["penalty"] = penalty
 
+def _routePrefix(job):
+        p, allowed, counting = job
+        snapshot = _worker["snapshot"]
+        if not counting:
+                faces, costs = snapshot.shortestPaths(snapshot.getServers(p), allowed, _worker["penalty"])
+                return p, faces, costs, None
+        stats = RouteStats()
+        start = time.time()
+        faces, costs = snapshot.shortestPaths(snapshot.getServers(p), allowed, _worker["penalty"], stats)
+        stats.searches = 1
+        stats.prefixTime[p] = time.time() - start
+        return p, faces, costs, stats
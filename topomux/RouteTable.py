@@ -0,0 +1,189 @@
+from array import array
+import collections
+
+class RouteTable (collections.Mapping):
+        """
+        The route of every node to every prefix, stored column-wise: for
+        each prefix an array of next hops, as node indexes or -1 if there is
+        none, and an array of costs, NaN for unreachable prefixes. Both are
+        indexed by the position of the node in self.nodes.
+
+        The table is a read-only mapping from node to a mapping from prefix
+        to a (face, cost) pair, with None for a missing face or cost, so it
+        reads like a dict of dicts. Routes are written with set and
+        setColumn.
+        """
+
+        def __init__(self, nodes=(), prefixes=()):
+                """ Constructor. All routes of the nodes to the prefixes are
+                    initially unreachable.
+                """
+                self.nodes = list(nodes)
+                self.index = {n: i for i, n in enumerate(self.nodes)}
+                self.faces = {}
+                self.costs = {}
+                for p in prefixes:
+                        self.addPrefix(p)
+
+        def addNode(self, node):
+                """ Adds a node whose routes are all unreachable
+                """
+                self.index[node] = len(self.nodes)
+                self.nodes.append(node)
+                for p in self.faces:
+                        self.faces[p].append(-1)
+                        self.costs[p].append(float('nan'))
+
+        def addPrefix(self, prefix):
+                """ Adds a prefix no node can reach
+                """
+                self.faces[prefix] = array('i', [-1]) * len(self.nodes)
+                self.costs[prefix] = array('d', [float('nan')]) * len(self.nodes)
+
+        def removePrefix(self, prefix):
+                """ Drops the routes to prefix
+                """
+                self.faces.pop(prefix, None)
+                self.costs.pop(prefix, None)
+
+        def getPrefixes(self):
+                """ Returns the prefixes of the table
+                """
+                return self.faces.keys()
+
+        def route(self, node, prefix):
+                """ Returns the (face, cost) route of node to prefix
+                """
+                i = self.index[node]
+                face, cost = self.faces[prefix][i], self.costs[prefix][i]
+                return (None if face == -1 else self.nodes[face], None if cost != cost else cost)
+
+        def set(self, node, prefix, face, cost):
+                """ Sets the route of node to prefix, with None for no face
+                    or no cost
+                """
+                i = self.index[node]
+                self.faces[prefix][i] = -1 if face == None else self.index[face]
+                self.costs[prefix][i] = float('nan') if cost == None else cost
+
+        def prefixRoutes(self, prefix):
+                """ Returns a read-only view of the routes to prefix
+                """
+                return PrefixRoutes(self.nodes, self.index, self.faces[prefix], self.costs[prefix])
+
+        def column(self, prefix):
+                """ Returns the (faces, costs) arrays of prefix, indexed by
+                    node position. They are the table's own storage.
+                """
+                return self.faces[prefix], self.costs[prefix]
+
+        @staticmethod
+        def toColumn(faces, costs):
+                """ Returns copies of faces and costs in the table's storage
+                    types, with infinite costs replaced by NaN
+                """
+                inf = float('+inf')
+                faces = RouteTable._copy(faces, 'i')
+                costs = RouteTable._copy(costs, 'd')
+                if inf in costs:
+                        for i, cost in enumerate(costs):
+                                if cost == inf:
+                                        costs[i] = float('nan')
+                return faces, costs
+
+        @staticmethod
+        def _copy(values, typecode):
+                """ Returns a copy of values as an array of typecode; arrays
+                    are copied whole rather than element by element
+                """
+                if isinstance(values, array):
+                        return values[:] if values.typecode == typecode else array(typecode, values.tolist())
+                return array(typecode, values)
+
+        def setColumn(self, prefix, nodes, faces, costs):
+                """ Replaces the routes to prefix. faces and costs are indexed
+                    by the position of a node in nodes, and faces hold such
+                    positions or -1. Infinite costs are unreachable.
+                """
+                inf = float('+inf')
+                if nodes is self.nodes or nodes == self.nodes:
+                        self.faces[prefix], self.costs[prefix] = self.toColumn(faces, costs)
+                        return
+
+                # nodes are numbered differently; positions are translated
+                position = [self.index[n] for n in nodes]
+                ownFaces = array('i', [-1]) * len(self.nodes)
+                ownCosts = array('d', [float('nan')]) * len(self.nodes)
+                for i, k in enumerate(position):
+                        if faces[i] != -1:
+                                ownFaces[k] = position[faces[i]]
+                        if costs[i] != inf:
+                                ownCosts[k] = costs[i]
+                self.faces[prefix], self.costs[prefix] = ownFaces, ownCosts
+
+        def __getitem__(self, node):
+                return NodeRoutes(self, self.index[node])
+
+        def __contains__(self, node):
+                return node in self.index
+
+        def __iter__(self):
+                return iter(self.nodes)
+
+        def __len__(self):
+                return len(self.nodes)
+
+class NodeRoutes (collections.Mapping):
+        """
+        Read-only view of the routes of one node of a RouteTable, mapping
+        each prefix to a (face, cost) pair
+        """
+
+        def __init__(self, table, i):
+                self.table = table
+                self.i = i
+
+        def __getitem__(self, prefix):
+                table = self.table
+                face, cost = table.faces[prefix][self.i], table.costs[prefix][self.i]
+                return (None if face == -1 else table.nodes[face], None if cost != cost else cost)
+
+        def __iter__(self):
+                return iter(self.table.faces)
+
+        def __len__(self):
+                return len(self.table.faces)
+
+        def __repr__(self):
+                return repr(dict(self.items()))
+
+class PrefixRoutes (collections.Mapping):
+        """
+        Read-only view of the routes of every node to one prefix, mapping
+        each node to a (face, cost) pair. faces and costs are indexed by
+        position in nodes, as in a RouteTable column; index maps each node
+        to its position.
+        """
+
+        def __init__(self, nodes, index, faces, costs):
+                self.nodes = nodes
+                self.index = index
+                self.faces = faces
+                self.costs = costs
+
+        def __getitem__(self, node):
+                i = self.index[node]
+                face, cost = self.faces[i], self.costs[i]
+                return (None if face == -1 else self.nodes[face], None if cost != cost else cost)
+
+        def __contains__(self, node):
+                return node in self.index
+
+        def __iter__(self):
+                return iter(self.nodes)
+
+        def __len__(self):
+                return len(self.nodes)
+
+        def __repr__(self):
+                return repr(dict(self.items()))
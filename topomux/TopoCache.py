@@ -0,0 +1,148 @@
+import hashlib, io, os, pickle, tempfile
+
+class TopoCache (object):
+        """
+        A content-addressed, size-bounded cache of topologies and routing
+        tables on disk. Every entry is a file named after its key in the
+        cache directory. Keys of topologies and routes are hashes of their
+        structure, so identical inputs map to the same entry whatever run
+        produced them. When the entries outgrow maxBytes the least recently
+        used ones are deleted.
+        """
+
+        def __init__(self, path, maxBytes=1 << 30):
+                """ Constructor. path is the cache directory, created if it
+                    does not exist
+                """
+                self.path = path
+                self.maxBytes = maxBytes
+                if not os.path.isdir(path):
+                        os.makedirs(path)
+
+        @staticmethod
+        def key(*parts):
+                """ Returns a key hashing the repr of each of parts, e.g. the
+                    name and parameters of the stage producing an entry
+                """
+                h = hashlib.sha1()
+                for part in parts:
+                        h.update(repr(part).encode("utf-8"))
+                        h.update(b"\0")
+                return h.hexdigest()
+
+        @staticmethod
+        def topologyKey(topo, restrict=None, *parts):
+                """ Returns a key hashing the structure of a topology: node
+                    names, labels and prefixes and edge endpoints, capacity,
+                    delay and label, plus the restriction map of a routing
+                    and any extra parts
+                """
+                snapshot = topo.compact()
+                h = hashlib.sha1()
+                for i, name in enumerate(snapshot.names):
+                        labels = snapshot.nodeLabels[snapshot.labelOffsets[i]:snapshot.labelOffsets[i + 1]]
+                        prefixes = snapshot.nodePrefixes[snapshot.prefixOffsets[i]:snapshot.prefixOffsets[i + 1]]
+                        h.update(repr((
+                                name,
+                                [snapshot.labelNames[l] for l in labels],
+                                [snapshot.prefixNames[p] for p in prefixes],
+                        )).encode("utf-8"))
+                edges = sorted(
+                        (snapshot.edgeA[k], snapshot.edgeB[k], snapshot.capacity[k], snapshot.delay[k],
+                         None if snapshot.edgeLabels[k] == -1 else snapshot.labelNames[snapshot.edgeLabels[k]])
+                        for k in range(len(snapshot.edgeA))
+                )
+                for edge in edges:
+                        h.update(repr(edge).encode("utf-8"))
+                h.update(repr(sorted(
+                        (p, None if l is None else sorted(l)) for p, l in (restrict or {}).items()
+                )).encode("utf-8"))
+                for part in parts:
+                        h.update(repr(part).encode("utf-8"))
+                return h.hexdigest()
+
+        def _file(self, key):
+                return os.path.join(self.path, key)
+
+        def get(self, key):
+                """ Returns the bytes stored under key, or None
+                """
+                try:
+                        with open(self._file(key), "rb") as f:
+                                data = f.read()
+                except IOError:
+                        return None
+                # another process may have evicted the entry since it was read
+                try:
+                        os.utime(self._file(key), None)
+                except OSError:
+                        pass
+                return data
+
+        def put(self, key, data):
+                """ Stores bytes under key, then evicts the least recently
+                    used entries if the cache is over its size bound
+                """
+                fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                        f.write(data)
+                os.rename(tmp, self._file(key))
+                self._evict()
+
+        def _evict(self):
+                entries = []
+                for name in os.listdir(self.path):
+                        if name.startswith(".tmp"):
+                                continue
+                        try:
+                                st = os.stat(os.path.join(self.path, name))
+                        except OSError:
+                                continue
+                        entries.append((st.st_mtime, name, st.st_size))
+                total = sum(size for _, _, size in entries)
+                for _, name, size in sorted(entries):
+                        if total <= self.maxBytes:
+                                break
+                        # entries evicted concurrently count as removed
+                        try:
+                                os.remove(os.path.join(self.path, name))
+                        except OSError:
+                                pass
+                        total -= size
+
+        def memoizeTopology(self, key, build):
+                """ Returns the topology stored under key, calling build()
+                    to create and store it on a miss. Either way the result
+                    is a plain Topology rebuilt from the stored snapshot, so
+                    hits and misses return the same thing; attributes of a
+                    Topology subclass returned by build(), such as
+                    ImportedTopology.topolo, are not kept.
+                """
+                data = self.get(key)
+                if data != None:
+                        return pickle.loads(data).toTopology()
+                snapshot = build().compact()
+                self.put(key, pickle.dumps(snapshot, 2))
+                return snapshot.toTopology()
+
+        def routesKey(self, routes):
+                """ Returns the key of the routes an IcnRoutes would compute
+                """
+                return self.topologyKey(routes.topo, routes.restrict, routes.penalty)
+
+        def loadRoutes(self, routes):
+                """ Fills the hops of an IcnRoutes from the cache. Returns
+                    False if its routes are not cached.
+                """
+                data = self.get(self.routesKey(routes))
+                if data == None:
+                        return False
+                routes.importroutingtables(io.BytesIO(data), markServing=False)
+                return True
+
+        def storeRoutes(self, routes):
+                """ Stores the hops of an IcnRoutes in the cache
+                """
+                f = io.BytesIO()
+                routes._writeBinary(f, sorted(str(n) for n in routes.hops))
+                self.put(self.routesKey(routes), f.getvalue())
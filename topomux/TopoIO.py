@@ -0,0 +1,111 @@
+import contextlib, gzip, struct, sys
+from array import array
+
+# header of binary routing tables: magic, format version, number of nodes
+# and number of prefixes, all little-endian
+ROUTES_MAGIC = b"ICRT"
+ROUTES_VERSION = 1
+_header = struct.Struct("<4sIII")
+_length = struct.Struct("<I")
+
+@contextlib.contextmanager
+def openFile(f, mode="r"):
+        """
+        Yields a file object for f, which may be a path or an already open
+        file object. Paths ending in ".gz" are opened through gzip. Files
+        opened here are closed on exit; file objects are left open.
+        """
+        if hasattr(f, "read") or hasattr(f, "write"):
+                yield f
+                return
+        if f.endswith(".gz"):
+                fh = gzip.open(f, mode if "b" in mode else mode + "b")
+        else:
+                fh = open(f, mode, 1 << 16)
+        try:
+                yield fh
+        finally:
+                fh.close()
+
+def fileName(f):
+        """ Returns a printable name for a path or file object
+        """
+        return getattr(f, "name", f)
+
+def writeLines(f, lines, batch=4096):
+        """ Writes an iterable of lines to f, joining them in batches
+        """
+        buf = []
+        for line in lines:
+                buf.append(line)
+                if len(buf) >= batch:
+                        f.write("".join(buf))
+                        del buf[:]
+        f.write("".join(buf))
+
+def _toBytes(a):
+        """ Returns the little-endian bytes of an array
+        """
+        if sys.byteorder == "big":
+                a = array(a.typecode, a)
+                a.byteswap()
+        return a.tobytes() if hasattr(a, "tobytes") else a.tostring()
+
+def writeRouteTable(f, nodeCount, prefixes, columns):
+        """
+        Writes a routing table in the binary format to the file object f.
+        prefixes is the list of prefix names and columns holds one (faces,
+        costs) pair per prefix, in the same order. Each is indexed by node
+        id: faces holds the id of the next hop, or -1 if there is none, and
+        costs the route cost, NaN for unreachable prefixes.
+
+        After the header each prefix is stored as its length and UTF-8 name,
+        then come the faces as int32 and the costs as float64 of every
+        prefix in turn.
+        """
+        f.write(_header.pack(ROUTES_MAGIC, ROUTES_VERSION, nodeCount, len(prefixes)))
+        for p in prefixes:
+                name = p.encode("utf-8")
+                f.write(_length.pack(len(name)))
+                f.write(name)
+        for faces, costs in columns:
+                f.write(_toBytes(array("i", faces)))
+                f.write(_toBytes(array("d", costs)))
+
+def _fromBytes(typecode, data, start, count):
+        """ Returns an array of count little-endian items of data, read from
+            offset start
+        """
+        a = array(typecode)
+        end = start + count * a.itemsize
+        if hasattr(a, "frombytes"):
+                a.frombytes(data[start:end])
+        else:
+                a.fromstring(data[start:end])
+        if sys.byteorder == "big":
+                a.byteswap()
+        return a, end
+
+def readRouteTable(data):
+        """
+        Parses a routing table in the binary format from a byte string, as
+        written by writeRouteTable.
+
+        Returns (nodeCount, prefixes, columns)
+        """
+        magic, version, nodeCount, prefixCount = _header.unpack_from(data, 0)
+        if magic != ROUTES_MAGIC or version != ROUTES_VERSION:
+                raise ValueError("not a version %d routing table" % ROUTES_VERSION)
+        offset = _header.size
+        prefixes = []
+        for _ in range(prefixCount):
+                length, = _length.unpack_from(data, offset)
+                offset += _length.size
+                prefixes.append(str(data[offset:offset + length].decode("utf-8")))
+                offset += length
+        columns = []
+        for _ in range(prefixCount):
+                faces, offset = _fromBytes("i", data, offset, nodeCount)
+                costs, offset = _fromBytes("d", data, offset, nodeCount)
+                columns.append((faces, costs))
+        return nodeCount, prefixes, columns
@@ -1,7 +1,18 @@
-import random, itertools
+import random, itertools, math, bisect
 from Topology import Topology
 
-def preferentialAttachment(topo_list, scalar=1.0, **kwargs):
+def _random(rng):
+        """ Returns the random.Random to draw from for rng, which may be a
+            random.Random instance, a seed for a new one, or None for the
+            random module
+        """
+        if rng == None:
+                return random
+        if not isinstance(rng, random.Random):
+                return random.Random(rng)
+        return rng
+
+def preferentialAttachment(topo_list, scalar=1.0, method="pairwise", rng=None, **kwargs):
         """
         Creates links between topologies in the topo_list. For each pair of
         topologies t1, t2 in the list a pair of nodes (a in t1), (b in t2) will
@@ -18,38 +29,159 @@ def preferentialAttachment(topo_list, scalar=1.0, **kwargs):
         of labels; any nodes with one or more of those labels may be used in
         attachment. If filter is None, it will be treated as the universal set.
         
+        The degrees are taken when the pair of topologies is reached, so the
+        links created between t1 and t2 do not change the probabilities of
+        the other pairs of t1 and t2; links created for earlier pairs of
+        topologies do count.
+        
+        method selects how the edges are drawn; both draw the same
+        distribution of edges. "pairwise" evaluates the probability of every
+        pair of candidates. "grouped" groups the candidates of t1 and t2 by
+        degree; all pairs in a block of two degree classes share one
+        probability, so the block is sampled by skipping over it with
+        geometrically distributed gaps, in O(D1 * D2 + edges) time, where D1
+        and D2 are the numbers of distinct degrees.
+        
+        rng is the source of randomness: a random.Random instance, a seed
+        for a new one, or None to use the random module.
+        
         Any extra kwargs provided will be passed to the addEdge function when
         inter-topology links are created.
         """
         
+        if not method in ("pairwise", "grouped"):
+                raise ValueError("unknown attachment method: %r" % (method,))
+        rng = _random(rng)
+        
         # create deep copies of input topos because we will modify the nodes
         # we will also use this dict to map a topology to its prefix
-        t = {x.copy(): (n,f) for n,x,f in topo_list}
+        copies = [x.copy() for _, x, _ in topo_list]
+        t = {c: (n, f) for c, (n, _, f) in zip(copies, topo_list)}
+        
+        # add prefixes to node names
+        for c in copies:
+                for a in list(c.nodeSet):
+                        c.renameNode(a, t[c][0] + "_" + a.name)
         
         # create new empty topology, then copy nodes and edges from components
         tm = Topology()
-        tm.nodeSet = set.union(*[x.nodeSet for x in t])
-        tm.edgeSet = set.union(*[x.edgeSet for x in t])
-        
-        # add prefixes to node names
-        for c in t:
+        for c in copies:
                 for a in c.nodeSet:
-                        a.name = t[c][0] + "_" + a.name
-        
-        # returns the probability that a, b should have an edge based on the
-        # degrees of a and b and total edges in t1 and t2
-        def p(a, b, t1, t2):
-                if t[t1][1] != None and t[t1][1] & a.labels == set():
-                        return 0.0
-                if t[t2][1] != None and t[t2][1] & b.labels == set():
-                        return 0.0
-                return scalar/2.0 * (a.getDegree() + b.getDegree()) / (len(t1.edgeSet) + len(t2.edgeSet))
-        
-        # add edge with probability p for each pair of nodes (a, b)
-        for t1, t2 in itertools.combinations(t, 2):
-                for a, b in itertools.product(t1.nodeSet, t2.nodeSet):
-                        if random.random() < p(a, b, t1, t2):
-                                tm.addEdge(a, b, **kwargs)
-
-                              
+                        tm.insertNode(a)
+                for e in c.edgeSet:
+                        tm.insertEdge(e)
+        
+        # returns the attachment candidates of c in name order, found through
+        # its label index; nodes outside the filter never get an edge
+        def candidates(c):
+                nodes = c.nodeSet if t[c][1] == None else c.getNodesWithLabels(t[c][1])
+                return sorted(nodes, key=lambda x: x.name)
+        
+        # returns the attachment candidates of c grouped by degree, as a
+        # sorted list of (degree, nodes) pairs
+        def degreeClasses(c):
+                classes = {}
+                for a in candidates(c):
+                        classes.setdefault(a.getDegree(), []).append(a)
+                return sorted(classes.items())
+        
+        for t1, t2 in itertools.combinations(copies, 2):
+                
+                edges = len(t1.edgeSet) + len(t2.edgeSet)
+                
+                # add an edge to each pair of nodes (a, b) with probability
+                # based on their degrees, frozen before the first edge, and
+                # the total edges in t1 and t2
+                if method == "pairwise":
+                        nodes1 = [(a, a.getDegree()) for a in candidates(t1)]
+                        nodes2 = [(b, b.getDegree()) for b in candidates(t2)]
+                        for (a, d1), (b, d2) in itertools.product(nodes1, nodes2):
+                                if rng.random() < scalar/2.0 * (d1 + d2) / edges:
+                                        tm.addEdge(a, b, **kwargs)
+                        continue
+                
+                # visit the pairs of each block of degree classes which get an
+                # edge, skipping the others a geometric number of pairs at once
+                classes2 = degreeClasses(t2)
+                for d1, nodes1 in degreeClasses(t1):
+                        for d2, nodes2 in classes2:
+                                q = scalar/2.0 * (d1 + d2) / edges
+                                if q <= 0.0:
+                                        continue
+                                size = len(nodes1) * len(nodes2)
+                                i = -1
+                                while True:
+                                        if q < 1.0:
+                                                i += 1 + int(math.log(1.0 - rng.random()) / math.log(1.0 - q))
+                                        else:
+                                                i += 1
+                                        if i >= size:
+                                                break
+                                        tm.addEdge(nodes1[i // len(nodes2)], nodes2[i % len(nodes2)], **kwargs)
+        
         return tm
+
+def attachLayer(topo, count, filter=None, name="leaf_%d", labels=[], prefixes=[], distribution="rank", exponent=2.0, rng=None, **kwargs):
+        """
+        Adds count new leaf nodes to topo, each with one edge to a node of
+        the target layer: the nodes with one or more of the labels in filter,
+        or all nodes if filter is None. Targets are ordered by degree, then
+        name, and chosen with the given distribution:
+        
+         "rank"    - the target at rank int(u ** exponent * len(targets)) for
+                     a uniform u, so exponent > 1 favours low-degree nodes
+         "degree"  - with probability proportional to max(degree, 1) **
+                     exponent, so exponent 1 is preferential attachment
+         "uniform" - with equal probability
+        
+        All targets are drawn in one batch, using degrees taken before any
+        leaf is attached, and the nodes and edges are inserted through
+        Topology.addNodes and addEdges.
+        
+        name is a format string turned into the node name with the number of
+        the leaf, counting from 0. Every leaf gets the labels; prefixes is
+        either a list of format strings filled in with the "name" and "i"
+        of the leaf, e.g. "/overlay/phy/%(name)s", or a function called with
+        the number and name of a leaf which returns its prefixes.
+        
+        rng is the source of randomness as for preferentialAttachment. Any
+        extra kwargs are passed to the constructor of each new edge.
+        
+        Returns the list of new nodes
+        """
+        if not distribution in ("rank", "degree", "uniform"):
+                raise ValueError("unknown attachment distribution: %r" % (distribution,))
+        rng = _random(rng)
+        targets = topo.nodeSet if filter == None else topo.getNodesWithLabels(filter)
+        if not targets:
+                raise ValueError("no nodes to attach to")
+        degrees = {a: a.getDegree() for a in targets}
+        targets = sorted(targets, key=lambda x: (degrees[x], x.name))
+        
+        # map one batch of uniform draws to target ranks
+        draws = [rng.random() for _ in range(count)]
+        size = len(targets)
+        if distribution == "rank":
+                ranks = [int(u ** exponent * size) for u in draws]
+        elif distribution == "uniform":
+                ranks = [int(u * size) for u in draws]
+        else:
+                bounds, total = [], 0.0
+                for a in targets:
+                        total += max(degrees[a], 1) ** exponent
+                        bounds.append(total)
+                ranks = [bisect.bisect_right(bounds, u * total) for u in draws]
+        
+        names = [name % i for i in range(count)]
+        if callable(prefixes):
+                entries = [(x, {"prefixes": prefixes(i, x)}) for i, x in enumerate(names)]
+        elif any("%" in p for p in prefixes):
+                entries = [
+                        (x, {"prefixes": [p % {"name": x, "i": i} for p in prefixes]})
+                        for i, x in enumerate(names)
+                ]
+        else:
+                entries = [(x, {"prefixes": prefixes}) for x in names]
+        leaves = topo.addNodes(entries, labels=labels)
+        topo.addEdges([(a, targets[min(r, size - 1)]) for a, r in zip(leaves, ranks)], **kwargs)
+        return leaves
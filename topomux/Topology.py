@@ -1,3 +1,7 @@
+from array import array
+import heapq
+import TopoIO
+
 class Topology (object):
         """
         A topology is a set of Nodes with Edges between them. This particular
@@ -8,9 +12,13 @@ class Topology (object):
         class Node (object):
                 """
                 A Node within this Topology. Nodes may have a name, a set of
-                labels, and a set of prefixes.
+                labels, and a set of prefixes. Labels and prefixes should be
+                changed through the methods below, which keep the indexes of
+                the topology holding the node up to date.
                 """
                 
+                __slots__ = ("name", "labels", "prefixes", "edges", "_adjacency", "_topo")
+                
                 def __init__(self, name, labels=[], prefixes=[]):
                         """
                         Constructor for a Node.
@@ -19,42 +27,92 @@ class Topology (object):
                         self.labels = set(labels)
                         self.prefixes = set(prefixes)
                         self.edges = set([])
+                        self._adjacency = {}
+                        self._topo = None
                 
                 def addLabel(self, label):
                         """ Adds a label to this Node's label set
                         """
-                        self.labels |= set([label])
+                        self.labels.add(label)
+                        if self._topo != None:
+                                self._topo._index(self._topo._labelIndex, label, self)
+                        self._changed()
+                
+                def removeLabel(self, label):
+                        """ Removes a label from this Node's label set
+                        """
+                        self.labels.discard(label)
+                        if self._topo != None:
+                                self._topo._unindex(self._topo._labelIndex, label, self)
+                        self._changed()
                 
                 def addPrefix(self, prefix):
                         """ Adds a prefix to this Node's prefix set
                         """
-                        self.prefixes |= set([prefix])
+                        self.prefixes.add(prefix)
+                        if self._topo != None:
+                                self._topo._index(self._topo._prefixIndex, prefix, self)
+                        self._changed()
                 
-                def getNeighbors(self, filter=None, delay=False, penalty=float('+inf')):
-                        """ Returns a set containing the neighbors of this node
+                def removePrefix(self, prefix):
+                        """ Removes a prefix from this Node's prefix set
+                        """
+                        self.prefixes.discard(prefix)
+                        if self._topo != None:
+                                self._topo._unindex(self._topo._prefixIndex, prefix, self)
+                        self._changed()
+                
+                def _changed(self):
+                        """ Tells the topology holding this node that it changed
+                        """
+                        if self._topo != None:
+                                self._topo.version += 1
+                
+                def _getAdjacency(self, filter=None):
+                        """ Returns a cached (allowed, other) pair of dicts mapping
+                            each neighbor to the lowest delay of an edge reaching
+                            it; allowed covers edges whose label passes filter,
+                            other the neighbors reachable only through the rest
                         """
+                        key = None if filter == None else frozenset(filter)
+                        if key in self._adjacency:
+                                return self._adjacency[key]
                         
-                        ret = set()
+                        allowed, other = {}, {}
                         for edge in self.edges:
-                                if filter == None or edge.label in filter:
-                                        ret |= set([x for x in list(edge.pair) if x != self])
+                                target = allowed if key == None or edge.label in key else other
+                                for n in edge.pair:
+                                        if n != self and (not n in target or target[n] > edge.delay):
+                                                target[n] = edge.delay
+                        for n in allowed:
+                                other.pop(n, None)
                         
-                        if delay:
-                                ret = {
-                                        n: next(x for x in self.edges if x.pair & set([n]) != set()).delay
-                                        for n in ret
-                                }
-                                for edge in self.edges:
-                                        other_node = next(x for x in edge.pair if x != self)
-                                        if not other_node in ret:
-                                                ret[other_node] = edge.delay + penalty
-                                
+                        self._adjacency[key] = (allowed, other)
+                        return allowed, other
+                
+                def _invalidate(self):
+                        """ Drops the cached adjacency; called whenever one of
+                            this node's edges is added or relabelled
+                        """
+                        self._adjacency.clear()
+                        self._changed()
+                
+                def getNeighbors(self, filter=None, delay=False, penalty=float('+inf')):
+                        """ Returns a set containing the neighbors of this node
+                        """
+                        allowed, other = self._getAdjacency(filter)
+                        if not delay:
+                                return set(allowed)
+                        
+                        ret = dict(allowed)
+                        for n, d in other.items():
+                                ret[n] = d + penalty
                         return ret
                 
                 def getDegree(self, filter=None):
                         """ Returns the number of neighbors
                         """
-                        return len(self.getNeighbors(filter))
+                        return len(self._getAdjacency(filter)[0])
                 
                 def copy(self):
                         """ Returns a copy of the Node object - edges
@@ -77,17 +135,64 @@ class Topology (object):
                 An Edge within this Topology. Edges have a capacity and delay, 
                 and may have a label which classifies the edge.
                 """
+                
+                __slots__ = ("pair", "_capacity", "_delay", "_label", "_topo")
 
                 def __init__(self, a, b, capacity=10.0, delay=2.0, label=None):
                         """ Constructor
                         """
                         self.pair = set([a, b])
-                        self.capacity = capacity
-                        self.delay = delay
-                        self.label = label
+                        self._capacity = capacity
+                        self._delay = delay
+                        self._label = label
+                        self._topo = None
                         if a != None and b != None:
-                                a.edges |= set([self])
-                                b.edges |= set([self])
+                                a.edges.add(self)
+                                b.edges.add(self)
+                                a._invalidate()
+                                b._invalidate()
+                
+                @property
+                def capacity(self):
+                        """ The capacity of this edge
+                        """
+                        return self._capacity
+                
+                @capacity.setter
+                def capacity(self, capacity):
+                        self._capacity = capacity
+                        for n in self.pair:
+                                if n != None:
+                                        n._changed()
+                
+                @property
+                def delay(self):
+                        """ The delay of this edge, the cost of routing over it
+                        """
+                        return self._delay
+                
+                @delay.setter
+                def delay(self, delay):
+                        self._delay = delay
+                        for n in self.pair:
+                                if n != None:
+                                        n._invalidate()
+                
+                @property
+                def label(self):
+                        """ The label which classifies this edge
+                        """
+                        return self._label
+                
+                @label.setter
+                def label(self, label):
+                        if self._topo != None:
+                                self._topo._unindex(self._topo._edgeLabelIndex, self._label, self)
+                                self._topo._index(self._topo._edgeLabelIndex, label, self)
+                        self._label = label
+                        for n in self.pair:
+                                if n != None:
+                                        n._invalidate()
 
 
         def __init__(self):
@@ -95,13 +200,24 @@ class Topology (object):
                 """
                 self.nodeSet = set()
                 self.edgeSet = set()
+                self._nodeIndex = {}
+                self._edgeIndex = {}
+                
+                # label -> nodes, prefix -> nodes serving it and edge label
+                # -> edges, kept up to date by the Node and Edge methods
+                self._labelIndex = {}
+                self._prefixIndex = {}
+                self._edgeLabelIndex = {}
+                
+                # incremented by every change made through the Topology,
+                # Node and Edge methods, so cached results can be checked
+                self.version = 0
         
         def copy(self):
                 """ Returns a deep copy of the topology
                 """
                 t = Topology()
-                nodeMapping = {x: x.copy() for x in self.nodeSet}
-                t.nodeSet = set([x for _,x in nodeMapping.items()])
+                nodeMapping = {x: t.insertNode(x.copy()) for x in self.nodeSet}
                 for e in self.edgeSet:
                         i = iter(e.pair)
                         a, b = nodeMapping[next(i)], nodeMapping[next(i)]
@@ -109,9 +225,10 @@ class Topology (object):
                 return t
         
         def findNode(self, name):
-                """ Returns the node with the given name
+                """ Returns the node with the given name, or None if there is
+                    no such node
                 """
-                return self.Node.get(name)
+                return self._nodeIndex.get(name)
         
         def addEdge(self, a, b, **kwargs):
                 """ Adds an edge between two Nodes. See the constructor of
@@ -119,14 +236,52 @@ class Topology (object):
                     
                     Returns the new Edge
                 """
-                newEdge = self.__class__.Edge(a, b, **kwargs)
-                self.edgeSet |= set([newEdge])
-                return newEdge
+                return self.insertEdge(self.__class__.Edge(a, b, **kwargs))
+        
+        def insertEdge(self, edge):
+                """ Adds an existing Edge object to the graph
+                    
+                    Returns the Edge
+                """
+                self.edgeSet.add(edge)
+                self._edgeIndex.setdefault(frozenset(edge.pair), edge)
+                self._index(self._edgeLabelIndex, edge.label, edge)
+                edge._topo = self
+                self.version += 1
+                return edge
+        
+        def addEdges(self, pairs, **kwargs):
+                """ Adds an edge for each (a, b) or (a, b, attributes) entry
+                    of pairs. The kwargs apply to every edge; a per-edge dict
+                    of attributes overrides them. See the constructor of
+                    Topology.Edge for the attributes.
+                    
+                    Returns the list of new Edges
+                """
+                Edge, edgeSet, edgeIndex = self.__class__.Edge, self.edgeSet, self._edgeIndex
+                ret = []
+                for pair in pairs:
+                        if len(pair) == 3:
+                                attributes = dict(kwargs)
+                                attributes.update(pair[2])
+                                edge = Edge(pair[0], pair[1], **attributes)
+                        else:
+                                edge = Edge(pair[0], pair[1], **kwargs)
+                        edgeSet.add(edge)
+                        edgeIndex.setdefault(frozenset(edge.pair), edge)
+                        self._index(self._edgeLabelIndex, edge.label, edge)
+                        edge._topo = self
+                        ret.append(edge)
+                self.version += 1
+                return ret
         
         def getEdge(self, a, b):
                 """ Returns the edge between nodes a and b, if it exists
                 """
-                return [x for x in self.edgeSet if x.pair == set([a, b])][0]
+                try:
+                        return self._edgeIndex[frozenset([a, b])]
+                except KeyError:
+                        raise KeyError("no edge between %s and %s" % (a, b))
         
         def addNode(self, name=None, **kwargs):
                 """ Adds a node to the graph. See the constructor of
@@ -139,12 +294,115 @@ class Topology (object):
                 """
                 if name == None:
                         name = "n%d" % len(self.nodeSet)
-                newNode = self.__class__.Node(name, **kwargs)
-                self.nodeSet |= set([newNode])
-                return newNode
+                return self.insertNode(self.__class__.Node(name, **kwargs))
+        
+        def insertNode(self, node):
+                """ Adds an existing Node object to the graph. Node names
+                    must be unique within a topology.
+                    
+                    Returns the Node
+                """
+                if node.name in self._nodeIndex:
+                        raise ValueError("duplicate node name %r" % (node.name,))
+                self.nodeSet.add(node)
+                self._nodeIndex[node.name] = node
+                self._indexNode(node)
+                node._topo = self
+                self.version += 1
+                return node
+        
+        def addNodes(self, names, **kwargs):
+                """ Adds a node for each name or (name, attributes) entry of
+                    names. The kwargs are passed to the constructor of
+                    Topology.Node for every node; a per-node dict of
+                    attributes overrides them.
+                    
+                    Returns the list of new Nodes
+                """
+                Node = self.__class__.Node
+                ret = []
+                for name in names:
+                        if isinstance(name, tuple):
+                                attributes = dict(kwargs)
+                                attributes.update(name[1])
+                                ret.append(Node(name[0], **attributes))
+                        else:
+                                ret.append(Node(name, **kwargs))
+                index = {}
+                for node in ret:
+                        if node.name in self._nodeIndex or node.name in index:
+                                raise ValueError("duplicate node name %r" % (node.name,))
+                        index[node.name] = node
+                for node in ret:
+                        self._indexNode(node)
+                        node._topo = self
+                self.nodeSet.update(ret)
+                self._nodeIndex.update(index)
+                self.version += 1
+                return ret
         
         def getNode(self, name):
-                return [x for x in self.nodeSet if x.name == name][0]
+                """ Returns the node with the given name
+                """
+                try:
+                        return self._nodeIndex[name]
+                except KeyError:
+                        raise KeyError("no node named %r" % (name,))
+        
+        def renameNode(self, node, name):
+                """ Changes the name of a node in this graph, keeping the name
+                    index up to date
+                """
+                if name in self._nodeIndex and self._nodeIndex[name] != node:
+                        raise ValueError("duplicate node name %r" % (name,))
+                del self._nodeIndex[node.name]
+                node.name = name
+                self._nodeIndex[name] = node
+                self.version += 1
+        
+        def _index(self, index, key, item):
+                index.setdefault(key, set()).add(item)
+        
+        def _unindex(self, index, key, item):
+                items = index.get(key)
+                if items != None:
+                        items.discard(item)
+                        if not items:
+                                del index[key]
+        
+        def _indexNode(self, node):
+                for label in node.labels:
+                        self._index(self._labelIndex, label, node)
+                for prefix in node.prefixes:
+                        self._index(self._prefixIndex, prefix, node)
+        
+        def getNodesWithLabel(self, label):
+                """ Returns the set of nodes with the given label
+                """
+                return set(self._labelIndex.get(label, ()))
+        
+        def getNodesWithLabels(self, labels):
+                """ Returns the set of nodes with one or more of the labels
+                """
+                ret = set()
+                for label in labels:
+                        ret |= self._labelIndex.get(label, set())
+                return ret
+        
+        def getNodesWithPrefix(self, prefix):
+                """ Returns the set of nodes serving the given prefix
+                """
+                return set(self._prefixIndex.get(prefix, ()))
+        
+        def getEdgesWithLabel(self, label):
+                """ Returns the set of edges with the given label
+                """
+                return set(self._edgeLabelIndex.get(label, ()))
+        
+        def getLabels(self):
+                """ Returns all labels of nodes within the graph
+                """
+                return set(self._labelIndex)
         
         def labelAllNodes(self, label):
                 """ Adds the label to all nodes
@@ -167,10 +425,7 @@ class Topology (object):
         def getPrefixes(self):
                 """ Returns all prefixes served by nodes within the graph
                 """
-                ret = set()
-                for n in self.nodeSet:
-                        ret |= n.prefixes
-                return ret
+                return set(self._prefixIndex)
                 
         def getNodes(self):
                 """ Returns the nodeSet of this graph
@@ -187,100 +442,402 @@ class Topology (object):
                 """
                 return len(self.nodeSet)
         
-        def getMinimumSpanningTree(self):
-                """ Returns a set of edges in a MST of the graph (Prim's
-                    algorithm)
+        def getMinimumSpanningTree(self, filter=None, weight="delay"):
+                """ Returns a set of edges in a minimum spanning forest of the
+                    graph (Kruskal's algorithm). See the method of the same
+                    name of CompactTopology for the arguments.
+                """
+                snapshot = self.compact()
+                edges = snapshot.getEdges()
+                return set(edges[k] for k in snapshot.getMinimumSpanningTree(filter, weight))
+        
+        @classmethod
+        def LoadTopology(cls, nodesFile="icens-nodes.txt", edgesFile="icens-edges.txt"):
+                """ Builds a topology from files written by ExportTopology,
+                    given as paths or file objects. Node types become node
+                    labels; edges get their capacity, delay and label back.
+                    
+                    Returns (topology, nodes), where nodes is the list of
+                    node names indexed by node id
                 """
+                with TopoIO.openFile(nodesFile) as fn:
+                        lines = fn.read().splitlines()
+                rows = [x.split() for x in lines]
+                if any(len(x) != 3 for x in rows):
+                        # node names containing whitespace
+                        rows = [x.split(None, 1) for x in lines]
+                        rows = [[x[0]] + x[1].rsplit(None, 1) for x in rows]
+                nodes = [None] * len(rows)
+                types = {}
+                for i, name, kind in rows:
+                        nodes[int(i)] = name
+                        types.setdefault(kind, []).append(name)
                 
-                def isCandidate(mstNodes, edge):
-                        """ Helper method: returns True if edge links a node
-                            in mstNodes to a node not in mstNodes
-                        """
-                        i = iter(edge.pair)
-                        a, b = next(i), next(i)
-                        if a in mstNodes and not b in mstNodes:
-                                return True
-                        if b in mstNodes and not a in mstNodes:
-                                return True
-                        return False
-                
-                mstNodes = set([next(iter(self.nodeSet))])
-                mstEdges = set([])
-                while mstNodes != self.nodeSet:
-                        chosenEdge = min((
-                                e for e in self.edgeSet
-                                if isCandidate(mstNodes, e)
-                        ), key=lambda x: x.delay)
-                        mstEdges |= set([chosenEdge])
-                        mstNodes |= chosenEdge.pair
-                return mstEdges
-
-
-	def ExportTopology(self):
-		""" Exports the network topology to a file
+                t = cls()
+                for kind, names in sorted(types.items()):
+                        t.addNodes(names, labels=[kind])
+                
+                # edges are parsed column-wise from the whitespace separated
+                # fields of the whole file
+                with TopoIO.openFile(edgesFile) as fe:
+                        fields = fe.read().split()
+                byId = [t.getNode(x) for x in nodes]
+                t.addEdges(
+                        (byId[int(a)], byId[int(b)], {
+                                "capacity": float(c),
+                                "delay": float(d),
+                                "label": None if l == "None" else l,
+                        })
+                        for a, b, c, d, l in zip(
+                                fields[0::5], fields[1::5], fields[2::5], fields[3::5], fields[4::5]
+                        )
+                )
+                return t, nodes
+        
+        def compact(self):
+                """ Returns a frozen, array-backed CompactTopology snapshot of
+                    the graph
                 """
+                return CompactTopology(self)
+        
+        def ExportTopology(self, nodesFile="icens-nodes.txt", edgesFile="icens-edges.txt"):
+                """ Exports the network topology to a pair of files. See the
+                    method of the same name of CompactTopology for details.
+                """
+                return self.compact().ExportTopology(nodesFile, edgesFile)
+        
+        def NodeType(self, name):
+                """ Determine which layer of the graph a node belongs to
+                """
+                return _nodeType(name)
 
-		"""Store all nodes in array in order to assign IDs to be used for edges export
-		"""
-		nodes = []
-		for nd in self.getNodes():
-			nodes.append(str(nd))
-
-		"""Export nodes names with their IDs to file
-		"""
-		print "Exporting nodes to file (icens-nodes.txt) !!!!!"
-		fn = open("icens-nodes.txt","w")
-		for i in range(0,len(nodes)):
-			fn.write(str(i) + " " + nodes[i] + " " + self.NodeType(nodes[i]) + "\n")
-		fn.close()
-
-		"""Export edges to same file
-		"""
-		print "Exporting edges to file (icens-edges.txt) !!!!!"
-		fe = open("icens-edges.txt","w")
-		for ne in self.getEdges():
-			elist = (list(ne.pair).__str__().replace('[','').replace(']','').replace(',','')).split()
-			fe.write(str(nodes.index(elist[0])) + " " + str(nodes.index(elist[1])) + " " + str(ne.capacity) + " " + str(ne.delay) + " " + str(ne.label) + "\n")
-
-		fe.close()
 
-		return nodes			
+def _nodeType(name):
+        """ Determine which layer of the graph a node belongs to, from the
+            prefix of its name
+        """
+        if name[0:3] == "agg":
+                return "aggregation"
+        elif name[0:3] == "com":
+                return "compute"
+        elif name[0:3] == "phy":
+                return "physical"
+        else:
+                return "unknown"
 
 
-	def NodeType(self,name):
-		"""Determine which layer of the graph a node belongs to
-		"""
-		if name[0:3] == "agg":
-			return "aggregation";
-		elif name[0:3] == "com":
-			return "compute"
-		elif name[0:3] == "phy":
-			return "physical"
-		else:
-			return "unknown" 		
+class CompactTopology (object):
+        """
+        A frozen snapshot of a Topology stored in flat arrays. Nodes are
+        numbered 0..n-1 in name order and edges are numbered in order of
+        their endpoint ids. Labels and prefixes are interned to integer ids.
+        
+        Adjacency is kept in CSR form: the half-edges of node i are
+        offsets[i] <= k < offsets[i + 1], leading to neighbors[k] over edge
+        halfEdges[k]. Edge attributes are indexed by edge id, node labels
+        and prefixes use the same offset scheme as the adjacency.
+        
+        The snapshot keeps references to the Nodes and Edges it was built
+        from, so results computed on it can be mapped back to the mutable
+        Topology; these references are dropped when it is pickled, after
+        which nodes are identified by name.
+        """
+        
+        # snapshots never change
+        version = 0
+        
+        def __init__(self, topo):
+                """ Constructor. topo is the Topology to take a snapshot of
+                """
+                nodes = sorted(topo.getNodes(), key=lambda x: x.name)
+                self.names = [x.name for x in nodes]
+                self.nodeIds = {x: i for i, x in enumerate(self.names)}
+                ids = {x: i for i, x in enumerate(nodes)}
+                
+                # interned labels (shared by nodes and edges) and prefixes
+                self.labelNames = sorted(
+                        set(l for x in nodes for l in x.labels) |
+                        set(e.label for e in topo.getEdges() if e.label != None)
+                )
+                self.labelIds = {x: i for i, x in enumerate(self.labelNames)}
+                self.prefixNames = sorted(set(p for x in nodes for p in x.prefixes))
+                self.prefixIds = {x: i for i, x in enumerate(self.prefixNames)}
+                
+                self.labelOffsets, self.nodeLabels = self._csr(
+                        sorted(self.labelIds[l] for l in x.labels) for x in nodes
+                )
+                self.prefixOffsets, self.nodePrefixes = self._csr(
+                        sorted(self.prefixIds[p] for p in x.prefixes) for x in nodes
+                )
+                
+                # edges, ordered by their endpoint ids
+                def endpoints(edge):
+                        i = iter(edge.pair)
+                        a = ids[next(i)]
+                        b = ids[next(i, nodes[a])]
+                        return (a, b) if a <= b else (b, a)
+                ends = sorted(((endpoints(e), e) for e in topo.getEdges()), key=lambda x: x[0])
+                edges = [e for _, e in ends]
+                self.edgeA = array('l', (a for (a, _), _ in ends))
+                self.edgeB = array('l', (b for (_, b), _ in ends))
+                self.capacity = array('d', (float(e.capacity) for e in edges))
+                self.delay = array('d', (float(e.delay) for e in edges))
+                self.edgeLabels = array('l', (
+                        -1 if e.label == None else self.labelIds[e.label]
+                        for e in edges
+                ))
+                
+                # adjacency, with per half-edge copies of the edge attributes
+                # so that traversals read contiguous memory
+                half = [[] for _ in nodes]
+                for k in range(len(edges)):
+                        half[self.edgeA[k]].append((self.edgeB[k], k))
+                        if self.edgeA[k] != self.edgeB[k]:
+                                half[self.edgeB[k]].append((self.edgeA[k], k))
+                self.offsets, self.halfEdges = self._csr([k for _, k in h] for h in half)
+                self.neighbors = array('l', (n for h in half for n, _ in h))
+                self.neighborDelays = array('d', (self.delay[k] for k in self.halfEdges))
+                self.neighborLabels = array('l', (self.edgeLabels[k] for k in self.halfEdges))
+                
+                # serving nodes of each prefix
+                servers = [[] for _ in self.prefixNames]
+                for i in range(len(nodes)):
+                        for k in range(self.prefixOffsets[i], self.prefixOffsets[i + 1]):
+                                servers[self.nodePrefixes[k]].append(i)
+                self.servers = [array('l', x) for x in servers]
+                
+                self._nodes = nodes
+                self._edges = edges
+        
+        @staticmethod
+        def _csr(rows):
+                """ Flattens an iterable of integer lists into an
+                    (offsets, values) pair of arrays
+                """
+                offsets, values = array('l', [0]), array('l')
+                for row in rows:
+                        values.extend(row)
+                        offsets.append(len(values))
+                return offsets, values
+        
+        def __getstate__(self):
+                state = self.__dict__.copy()
+                state["_nodes"] = state["_edges"] = None
+                return state
+        
+        def compact(self):
+                """ Returns the snapshot itself
+                """
+                return self
+        
+        def toTopology(self):
+                """ Returns a new mutable Topology with the nodes, labels,
+                    prefixes and edges of the snapshot
+                """
+                t = Topology()
+                for i, name in enumerate(self.names):
+                        t.insertNode(Topology.Node(
+                                name,
+                                [self.labelNames[l] for l in self.nodeLabels[self.labelOffsets[i]:self.labelOffsets[i + 1]]],
+                                [self.prefixNames[p] for p in self.nodePrefixes[self.prefixOffsets[i]:self.prefixOffsets[i + 1]]],
+                        ))
+                nodes = [t.getNode(x) for x in self.names]
+                t.addEdges(
+                        (nodes[self.edgeA[k]], nodes[self.edgeB[k]], {
+                                "capacity": self.capacity[k],
+                                "delay": self.delay[k],
+                                "label": None if self.edgeLabels[k] == -1 else self.labelNames[self.edgeLabels[k]],
+                        })
+                        for k in range(len(self.edgeA))
+                )
+                return t
+        
+        def getNodes(self):
+                """ Returns the nodes of the snapshot in id order: the original
+                    Nodes if they are known, the node names otherwise
+                """
+                return self._nodes if self._nodes != None else self.names
+        
+        def getEdges(self):
+                """ Returns the original Edges in id order, if they are known
+                """
+                return self._edges
+        
+        def getPrefixes(self):
+                """ Returns all prefixes served by nodes within the graph
+                """
+                return set(self.prefixNames)
+        
+        def getRank(self):
+                """ Returns number of nodes
+                """
+                return len(self.names)
+        
+        def getServers(self, prefix):
+                """ Returns the ids of the nodes serving a prefix
+                """
+                if not prefix in self.prefixIds:
+                        return array('l')
+                return self.servers[self.prefixIds[prefix]]
+        
+        def getNodesWithPrefix(self, prefix):
+                """ Returns the set of nodes serving a prefix, as returned by
+                    getNodes
+                """
+                nodes = self.getNodes()
+                return set(nodes[i] for i in self.getServers(prefix))
+        
+        def getLabelIds(self, labels):
+                """ Returns the set of ids of the given labels, ignoring labels
+                    which do not occur in the graph, or None if labels is None
+                """
+                if labels == None:
+                        return None
+                return frozenset(self.labelIds[l] for l in labels if l in self.labelIds)
+        
+        def shortestPaths(self, sources, allowed=None, penalty=float('+inf'), stats=None):
+                """ Runs a multi-source Dijkstra search from the given node
+                    ids. Edges whose label id is not in allowed cost their
+                    delay plus penalty; if allowed is None all edges are
+                    allowed. If stats is given, the relaxations attempted
+                    and applied are added to its counters.
+                    
+                    Returns (faces, costs) arrays indexed by node id: faces
+                    holds the neighbor on the path towards the nearest source
+                    (-1 for sources and unreachable nodes) and costs the path
+                    cost (inf for unreachable nodes)
+                """
+                offsets, neighbors = self.offsets, self.neighbors
+                delays, labels = self.neighborDelays, self.neighborLabels
+                faces = array('l', [-1]) * len(self.names)
+                costs = array('d', [float('+inf')]) * len(self.names)
+                
+                heap = []
+                for s in sources:
+                        costs[s] = 0.0
+                        heap.append((0.0, s))
+                heapq.heapify(heap)
+                applied = 0
+                
+                while heap:
+                        dist, a = heapq.heappop(heap)
+                        if dist > costs[a]:
+                                continue
+                        for k in range(offsets[a], offsets[a + 1]):
+                                cost = dist + delays[k]
+                                if allowed != None and not labels[k] in allowed:
+                                        cost += penalty
+                                b = neighbors[k]
+                                if cost < costs[b]:
+                                        costs[b] = cost
+                                        faces[b] = a
+                                        heapq.heappush(heap, (cost, b))
+                                        applied += 1
+                
+                # every reached node was settled once, scanning all its edges
+                if stats != None:
+                        stats.applied += applied
+                        for a in range(len(costs)):
+                                if costs[a] != float('+inf'):
+                                        stats.relaxations += offsets[a + 1] - offsets[a]
+                return faces, costs
+        
+        def getMinimumSpanningTree(self, filter=None, weight="delay"):
+                """ Returns a set of edge ids in a minimum spanning forest of
+                    the graph (Kruskal's algorithm), i.e. a minimum spanning
+                    tree of each connected component.
+                    
+                    If filter is a set of labels, only edges with one of
+                    those labels are considered. weight names the edge
+                    attribute to minimise, "delay" or "capacity". Ties are
+                    broken by edge id, so the result is reproducible.
+                """
+                weights = {"delay": self.delay, "capacity": self.capacity}
+                if not weight in weights:
+                        raise ValueError("unknown edge weight: %r" % (weight,))
+                weights = weights[weight]
+                
+                allowed = self.getLabelIds(filter)
+                candidates = sorted(
+                        (k for k in range(len(self.edgeA))
+                         if allowed == None or self.edgeLabels[k] in allowed),
+                        key=lambda k: (weights[k], k)
+                )
+                
+                # union-find over node ids with path halving and union by size
+                parent = array('l', range(len(self.names)))
+                size = array('l', [1]) * len(self.names)
+                def find(x):
+                        while parent[x] != x:
+                                parent[x] = parent[parent[x]]
+                                x = parent[x]
+                        return x
+                
+                mstEdges = set()
+                for k in candidates:
+                        a, b = find(self.edgeA[k]), find(self.edgeB[k])
+                        if a == b:
+                                continue
+                        if size[a] < size[b]:
+                                a, b = b, a
+                        parent[b] = a
+                        size[a] += size[b]
+                        mstEdges.add(k)
+                return mstEdges
+        
+        def ExportTopology(self, nodesFile="icens-nodes.txt", edgesFile="icens-edges.txt"):
+                """ Exports the network topology to a pair of files, given as
+                    paths or file objects. Each node is written as "id name
+                    type", each edge as "id id capacity delay label".
+                    
+                    Returns the list of node names, indexed by node id
+                """
+                print "Exporting nodes to file (%s) !!!!!" % TopoIO.fileName(nodesFile)
+                with TopoIO.openFile(nodesFile, "w") as fn:
+                        TopoIO.writeLines(fn, (
+                                "%d %s %s\n" % (i, name, _nodeType(name))
+                                for i, name in enumerate(self.names)
+                        ))
+                
+                print "Exporting edges to file (%s) !!!!!" % TopoIO.fileName(edgesFile)
+                labels = ["None" if l == -1 else self.labelNames[l] for l in self.edgeLabels]
+                with TopoIO.openFile(edgesFile, "w") as fe:
+                        TopoIO.writeLines(fe, (
+                                "%d %d %s %s %s\n" % (self.edgeA[k], self.edgeB[k], self.capacity[k], self.delay[k], labels[k])
+                                for k in range(len(self.edgeA))
+                        ))
+                
+                return list(self.names)
 
         
 class ImportedTopology (Topology):
-        """ Used to import topologies from FNSS or NetworkX. Simply copies
-            the nodes and edges; does not import the data of nodes or
-            edges.
+        """ Used to import topologies from FNSS or NetworkX. Copies the nodes
+            and edges, along with the capacity and delay of edges which
+            carry them (as FNSS edge attributes do). Values are taken as
+            they are, in the units the source topology uses.
         """
 
         def __init__(self, topo):
                 """ Constructor.
                     topo should be a NetworkX Graph object, or some other
-                    object with compatible nodes_iter and edges_iter methods
+                    object with compatible nodes and edges methods
                 """
                 super(ImportedTopology, self).__init__()
                 self._import_from(topo)
-           	self.topolo = topo
+                self.topolo = topo
      
         def _import_from(self, topo):
                 """ Imports the nodes and edges from the topo
                 """
-                nodemap = {}
-                for node, data in topo.nodes_iter(True):
-                        nodemap[node] = self.addNode(name=("n%d" % node))
-                for u, v, data in topo.edges_iter(None, True):
-                        self.addEdge(nodemap[u], nodemap[v])
-	
+                nodes = topo.nodes(data=True)
+                nodemap = dict(zip(
+                        (node for node, _ in nodes),
+                        self.addNodes("n%s" % (node,) for node, _ in nodes)
+                ))
+                
+                def attributes(data):
+                        return {k: float(data[k]) for k in ("capacity", "delay") if k in data}
+                self.addEdges(
+                        (nodemap[u], nodemap[v], attributes(data))
+                        for u, v, data in topo.edges(data=True)
+                )
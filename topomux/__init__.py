@@ -1,2 +1,4 @@
 from IcnRoutes import *
 from Topology  import *
+from TopoCache import *
+from RouteTable import *